@@ -0,0 +1,296 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PARSERS_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'parsers')
+
+sys.path.insert(0, BENCH_DIR)
+
+import fake_api  # noqa: E402
+
+# name -> (url, parse kwargs, iterate the streaming batch path)
+SCENARIOS = {
+  'single': ('https://www.bilibili.com/video/BV1Bench0001', {}, False),
+  'multi_p': ('https://www.bilibili.com/video/BV1BenchMP24', {'pages': 'all'}, False),
+  'collection_500': ('https://www.bilibili.com/video/BV1BenchCol5', {'batch': True}, True),
+  'favlist_200': ('https://www.bilibili.com/medialist/detail/media/md9001', {'batch': True}, True),
+  'bangumi_season': ('https://www.bilibili.com/bangumi/play/ss4242', {'batch': True}, False)
+}
+
+# name -> (latency seconds, jitter seconds) applied to every fake API response
+PROFILES = {
+  'local': (0.0, 0.0),
+  'broadband': (0.03, 0.01),
+  'mobile': (0.12, 0.06)
+}
+
+USAGE = '''usage: bench.py [--scenario NAME]... [--profile NAME]... [--iterations N]
+                [--latency MS --jitter MS] [--seed N] [--warm] [--probe-sizes]
+                [--rank-mirrors] [--certfile PEM --keyfile PEM] [--json]
+                [--replay DIR [--scale X]]
+
+scenarios: %s
+profiles:  %s
+
+Every scenario runs in a fresh interpreter against a local fake API so peak RSS
+is per scenario. Caches are cleared between iterations unless --warm is given.
+With --certfile the fake API speaks HTTPS; point SSL_CERT_FILE at the CA so the
+parser trusts it. With --replay the fake API is not started and each scenario
+is served from DIR/<scenario>.jsonl.gz (see round_trips.py record), with the
+recorded response times multiplied by --scale (0 disables the delays).''' % (', '.join(SCENARIOS), ', '.join(PROFILES))
+
+
+def _percentile(values, pct):
+  if not values:
+    return None
+  ordered = sorted(values)
+  k = (len(ordered) - 1) * pct / 100.0
+  lo = int(k)
+  hi = min(lo + 1, len(ordered) - 1)
+  return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def _peak_rss_kib():
+  try:
+    import resource
+  except ImportError:
+    return None
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def _clear_caches(bp):
+  for cache in (bp._METADATA_CACHE, bp._PLAYURL_CACHE, bp._MIRROR_SCORES, bp._PAGE_MAPS):
+    cache.clear()
+
+
+def archive_path(directory, name):
+  return os.path.join(directory, f'{name}.jsonl.gz')
+
+
+def child_command(name, iterations=1, warm=False, extra=None, scenario=None):
+  cmd = [sys.executable, os.path.abspath(__file__), '--child', name, '--iterations', str(iterations)]
+  if scenario is not None:
+    url, kwargs, streaming = scenario
+    cmd += ['--url', url, '--kwargs', json.dumps(kwargs)]
+    if streaming:
+      cmd.append('--stream')
+  if warm:
+    cmd.append('--warm')
+  if (extra or {}).get('probe_sizes'):
+    cmd.append('--probe-sizes')
+  if (extra or {}).get('rank_mirrors'):
+    cmd.append('--rank-mirrors')
+  return cmd
+
+
+def run_child_process(cmd, env):
+  proc = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+  if proc.returncode != 0:
+    raise RuntimeError(f'{cmd[3]} failed: {proc.stderr.strip()}')
+  return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run_child(name, iterations, warm, extra, scenario=None):
+  sys.path.insert(0, PARSERS_DIR)
+  import bilibili_parser as bp
+
+  url, kwargs, streaming = scenario or SCENARIOS[name]
+  kwargs = dict(kwargs, **extra)
+  if os.environ.get('BILI_BENCH_COOKIE'):
+    kwargs['cookie'] = os.environ['BILI_BENCH_COOKIE']
+  samples = []
+  items = 0
+  errors = 0
+  for _ in range(iterations):
+    if not warm:
+      _clear_caches(bp)
+    started = time.perf_counter()
+    if streaming:
+      for record in bp.iter_parse_bilibili(url, **kwargs):
+        if record.get('record') == 'trailer':
+          items = record.get('total') or 0
+          errors += record.get('failed') or 0
+    else:
+      result = bp.parse_bilibili(url, **kwargs)
+      items = result.get('resolved_count') or len(result.get('pages') or []) or 1
+    samples.append(time.perf_counter() - started)
+  transport = bp._TRANSPORT
+  sys.stdout.write(json.dumps({
+    'samples': samples,
+    'items': items,
+    'errors': errors,
+    'http_requests': transport.requests,
+    'http_misses': getattr(transport, 'misses', 0),
+    'peak_rss_kib': _peak_rss_kib()
+  }) + '\n')
+  return 0
+
+
+def run_scenario(api, name, iterations, warm, extra, replay=None, scale=1.0):
+  env = dict(os.environ)
+  env.pop('BILI_SHORT_LINK_CACHE', None)
+  env.pop('BILI_CACHE_DB', None)
+  if replay:
+    env['BILI_HTTP_REPLAY'] = archive_path(replay, name)
+    env['BILI_HTTP_REPLAY_SCALE'] = str(scale)
+  else:
+    env['BILI_API_BASE'] = api.base
+    api.reset_counts()
+  child = run_child_process(child_command(name, iterations, warm, extra), env)
+  counts = api.snapshot_counts() if api is not None else {}
+  samples = child['samples']
+  return {
+    'scenario': name,
+    'iterations': len(samples),
+    'items': child['items'],
+    'errors': child['errors'],
+    'p50_ms': round(_percentile(samples, 50) * 1000, 1),
+    'p95_ms': round(_percentile(samples, 95) * 1000, 1),
+    'mean_ms': round(statistics.mean(samples) * 1000, 1),
+    'requests_per_parse': round(child['http_requests'] / len(samples), 1),
+    'cdn_requests_per_parse': round(counts.get('cdn', 0) / len(samples), 1),
+    'endpoints': counts,
+    'peak_rss_kib': child['peak_rss_kib']
+  }
+
+
+def _print_table(rows):
+  cols = ('profile', 'scenario', 'p50_ms', 'p95_ms', 'requests_per_parse', 'items', 'errors', 'peak_rss_kib')
+  widths = [max(len(c), *(len(str(r.get(c))) for r in rows)) for c in cols]
+  sys.stdout.write('  '.join(c.ljust(w) for c, w in zip(cols, widths)) + '\n')
+  for r in rows:
+    sys.stdout.write('  '.join(str(r.get(c)).ljust(w) for c, w in zip(cols, widths)) + '\n')
+
+
+def main(argv):
+  scenarios = []
+  profiles = []
+  iterations = 5
+  latency = None
+  jitter = 0.0
+  seed = 1
+  warm = False
+  extra = {}
+  certfile = None
+  keyfile = None
+  as_json = False
+  child = None
+  child_scenario = None
+  replay = None
+  scale = 1.0
+  i = 1
+  while i < len(argv):
+    a = argv[i]
+    if a in ('-h', '--help'):
+      sys.stdout.write(USAGE + '\n')
+      return 0
+    if a == '--scenario' and i + 1 < len(argv):
+      scenarios.append(argv[i + 1])
+      i += 2
+      continue
+    if a == '--profile' and i + 1 < len(argv):
+      profiles.append(argv[i + 1])
+      i += 2
+      continue
+    if a == '--iterations' and i + 1 < len(argv):
+      iterations = max(1, int(argv[i + 1]))
+      i += 2
+      continue
+    if a == '--latency' and i + 1 < len(argv):
+      latency = float(argv[i + 1]) / 1000
+      i += 2
+      continue
+    if a == '--jitter' and i + 1 < len(argv):
+      jitter = float(argv[i + 1]) / 1000
+      i += 2
+      continue
+    if a == '--seed' and i + 1 < len(argv):
+      seed = int(argv[i + 1])
+      i += 2
+      continue
+    if a == '--certfile' and i + 1 < len(argv):
+      certfile = argv[i + 1]
+      i += 2
+      continue
+    if a == '--keyfile' and i + 1 < len(argv):
+      keyfile = argv[i + 1]
+      i += 2
+      continue
+    if a == '--replay' and i + 1 < len(argv):
+      replay = argv[i + 1]
+      i += 2
+      continue
+    if a == '--scale' and i + 1 < len(argv):
+      scale = float(argv[i + 1])
+      i += 2
+      continue
+    if a == '--child' and i + 1 < len(argv):
+      child = argv[i + 1]
+      i += 2
+      continue
+    if a == '--url' and i + 1 < len(argv):
+      child_scenario = (argv[i + 1], {}, False)
+      i += 2
+      continue
+    if a == '--kwargs' and i + 1 < len(argv) and child_scenario:
+      child_scenario = (child_scenario[0], json.loads(argv[i + 1]), child_scenario[2])
+      i += 2
+      continue
+    if a == '--stream' and child_scenario:
+      child_scenario = (child_scenario[0], child_scenario[1], True)
+    elif a == '--warm':
+      warm = True
+    elif a == '--probe-sizes':
+      extra['probe_sizes'] = True
+    elif a == '--rank-mirrors':
+      extra['rank_mirrors'] = True
+    elif a == '--json':
+      as_json = True
+    i += 1
+
+  if child:
+    return run_child(child, iterations, warm, extra, scenario=child_scenario)
+
+  unknown = [s for s in scenarios + profiles if s not in SCENARIOS and s not in PROFILES]
+  if unknown:
+    sys.stderr.write(f'unknown scenario or profile: {", ".join(unknown)}\n\n{USAGE}\n')
+    return 2
+  if replay:
+    runs = {'replay': (None, None)}
+  elif latency is not None:
+    runs = {'custom': (latency, jitter)}
+  else:
+    runs = {p: PROFILES[p] for p in (profiles or ['broadband'])}
+
+  rows = []
+  for profile, (lat, jit) in runs.items():
+    api = None
+    if not replay:
+      api = fake_api.FakeBilibiliAPI(latency=lat, jitter=jit, seed=seed, certfile=certfile, keyfile=keyfile)
+      api.start()
+    try:
+      for name in scenarios or list(SCENARIOS):
+        row = run_scenario(api, name, iterations, warm, extra, replay=replay, scale=scale)
+        row['profile'] = profile
+        if api is not None:
+          row['latency_ms'] = round(lat * 1000, 1)
+          row['jitter_ms'] = round(jit * 1000, 1)
+        rows.append(row)
+        if as_json:
+          sys.stdout.write(json.dumps(row, ensure_ascii=False) + '\n')
+          sys.stdout.flush()
+    finally:
+      if api is not None:
+        api.stop()
+  if not as_json:
+    _print_table(rows)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv))
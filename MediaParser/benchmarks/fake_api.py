@@ -0,0 +1,299 @@
+import collections
+import copy
+import json
+import os
+import random
+import ssl
+import sys
+import threading
+import time
+import urllib.parse
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures.json')
+
+# bvid -> page count and optional ugc season id
+VIDEOS = {
+  'BV1Bench0001': {'pages': 1},
+  'BV1BenchMP24': {'pages': 24},
+  'BV1BenchCol5': {'pages': 1, 'season': 5000}
+}
+UGC_SEASONS = {5000: 500}
+MEDIA_LISTS = {9001: 200}
+PGC_SEASONS = {4242: 26}
+
+SEGMENT_SECONDS = 1440
+CDN_OBJECT_SIZE = 8 * 1024 * 1024
+
+
+def _load_fixtures(path=FIXTURES_PATH):
+  with open(path, 'r', encoding='utf-8') as f:
+    return json.load(f)
+
+
+def _archive_bvid(season_id, index):
+  return f'BV1S{season_id}A{index:04d}'
+
+
+def _media_bvid(media_id, index):
+  return f'BV1M{media_id}A{index:04d}'
+
+
+def _cid_for(bvid, page=1):
+  return zlib.crc32(f'{bvid}:{page}'.encode('ascii')) % 1000000000 + 1
+
+
+class FakeBilibiliAPI:
+  def __init__(self, latency=0.0, jitter=0.0, seed=None, certfile=None, keyfile=None, fixtures=None):
+    self.latency = latency
+    self.jitter = jitter
+    self.fixtures = fixtures or _load_fixtures()
+    self.certfile = certfile
+    self.keyfile = keyfile
+    self._random = random.Random(seed)
+    self._lock = threading.Lock()
+    self.counts = collections.Counter()
+    self.server = None
+    self.thread = None
+
+  @property
+  def base(self):
+    host, port = self.server.server_address[:2]
+    scheme = 'https' if self.certfile else 'http'
+    return f'{scheme}://{host}:{port}'
+
+  def start(self, host='127.0.0.1', port=0):
+    api = self
+
+    class Handler(_Handler):
+      pass
+
+    Handler.api = api
+    self.server = _Server((host, port), Handler)
+    self.server.daemon_threads = True
+    if self.certfile:
+      ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+      ctx.load_cert_chain(self.certfile, self.keyfile)
+      self.server.socket = ctx.wrap_socket(self.server.socket, server_side=True)
+    self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+    self.thread.start()
+    return self.base
+
+  def stop(self):
+    if self.server is not None:
+      self.server.shutdown()
+      self.server.server_close()
+      self.server = None
+
+  def reset_counts(self):
+    with self._lock:
+      self.counts.clear()
+
+  def snapshot_counts(self):
+    with self._lock:
+      return dict(self.counts)
+
+  def _count(self, endpoint):
+    with self._lock:
+      self.counts[endpoint] += 1
+
+  def delay(self):
+    with self._lock:
+      spread = self._random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0
+    return max(0.0, self.latency + spread)
+
+  def _fixture(self, name):
+    return copy.deepcopy(self.fixtures[name])
+
+  def _dash(self, cid, duration):
+    deadline = int(time.time()) + 7200
+    dash = self._fixture('playurl')['data']['dash']
+    dash['duration'] = duration
+    for kind in ('video', 'audio'):
+      for stream in dash[kind]:
+        name = f'{cid}-{stream["id"]}-{stream.get("codecid", 0)}.m4s?deadline={deadline}'
+        stream['baseUrl'] = stream['base_url'] = f'{self.base}/cdn/{name}'
+        stream['backupUrl'] = stream['backup_url'] = [f'{self.base}/cdn-backup/{name}']
+    return dash
+
+  def view(self, query):
+    bvid = query.get('bvid') or f'BV1Aid{query.get("aid") or 0}'
+    spec = VIDEOS.get(bvid) or {'pages': 1}
+    body = self._fixture('view')
+    data = body['data']
+    data['bvid'] = bvid
+    data['aid'] = _cid_for(bvid, 0)
+    data['title'] = f'benchmark {bvid}'
+    data['videos'] = spec['pages']
+    pages = []
+    for page in range(1, spec['pages'] + 1):
+      entry = self._fixture('view_page')
+      entry['cid'] = _cid_for(bvid, page)
+      entry['page'] = page
+      entry['part'] = f'P{page}'
+      entry['duration'] = SEGMENT_SECONDS // 4
+      pages.append(entry)
+    data['pages'] = pages
+    data['cid'] = pages[0]['cid']
+    data['duration'] = sum(p['duration'] for p in pages)
+    if spec.get('season'):
+      season = self._fixture('ugc_season')
+      season['id'] = spec['season']
+      season['title'] = f'season {spec["season"]}'
+      season['ep_count'] = UGC_SEASONS.get(spec['season'], 0)
+      data['ugc_season'] = season
+    return body
+
+  def playurl(self, query):
+    body = self._fixture('playurl')
+    body['data']['timelength'] = SEGMENT_SECONDS * 250
+    body['data']['dash'] = self._dash(query.get('cid'), SEGMENT_SECONDS // 4)
+    return body
+
+  def pgc_season(self, query):
+    if query.get('ep_id'):
+      season_id = int(query['ep_id']) // 1000
+    else:
+      season_id = int(query.get('season_id') or 0)
+    body = self._fixture('pgc_season')
+    data = body['data']
+    data['season_id'] = season_id
+    data['title'] = data['season_title'] = f'bangumi {season_id}'
+    episodes = []
+    for index in range(1, PGC_SEASONS.get(season_id, 12) + 1):
+      ep = self._fixture('pgc_episode')
+      ep['id'] = season_id * 1000 + index
+      ep['bvid'] = f'BV1P{season_id}E{index:04d}'
+      ep['aid'] = ep['cid'] = _cid_for(ep['bvid'])
+      ep['title'] = str(index)
+      ep['long_title'] = f'episode {index}'
+      ep['duration'] = SEGMENT_SECONDS * 1000
+      episodes.append(ep)
+    data['episodes'] = episodes
+    return body
+
+  def pgc_playurl(self, query):
+    body = self._fixture('pgc_playurl')
+    body['result']['timelength'] = SEGMENT_SECONDS * 1000
+    body['result']['dash'] = self._dash(query.get('cid'), SEGMENT_SECONDS)
+    return body
+
+  def medialist_info(self, query):
+    media_id = int(query.get('media_id') or 0)
+    body = self._fixture('medialist_info')
+    data = body['data']
+    data['id'] = data['fid'] = media_id
+    data['title'] = f'favlist {media_id}'
+    data['media_count'] = MEDIA_LISTS.get(media_id, 0)
+    return body
+
+  def fav_resource_list(self, query):
+    media_id = int(query.get('media_id') or 0)
+    pn = int(query.get('pn') or 1)
+    ps = int(query.get('ps') or 20)
+    total = MEDIA_LISTS.get(media_id, 0)
+    body = self._fixture('fav_resource_list')
+    data = body['data']
+    data['info']['id'] = media_id
+    data['info']['media_count'] = total
+    medias = []
+    for index in range((pn - 1) * ps + 1, min(total, pn * ps) + 1):
+      media = self._fixture('fav_media')
+      media['bvid'] = _media_bvid(media_id, index)
+      media['id'] = _cid_for(media['bvid'], 0)
+      media['title'] = f'fav {index}'
+      media['duration'] = SEGMENT_SECONDS // 4
+      media['ugc']['first_cid'] = _cid_for(media['bvid'])
+      medias.append(media)
+    data['medias'] = medias
+    data['has_more'] = pn * ps < total
+    return body
+
+  def seasons_archives_list(self, query):
+    season_id = int(query.get('season_id') or 0)
+    page_num = int(query.get('page_num') or 1)
+    page_size = int(query.get('page_size') or 100)
+    total = UGC_SEASONS.get(season_id, 0)
+    body = self._fixture('seasons_archives_list')
+    data = body['data']
+    archives = []
+    for index in range((page_num - 1) * page_size + 1, min(total, page_num * page_size) + 1):
+      archive = self._fixture('season_archive')
+      archive['bvid'] = _archive_bvid(season_id, index)
+      archive['aid'] = _cid_for(archive['bvid'], 0)
+      archive['title'] = f'archive {index}'
+      archive['duration'] = SEGMENT_SECONDS // 4
+      archives.append(archive)
+    data['archives'] = archives
+    data['aids'] = [a['aid'] for a in archives]
+    data['meta'].update({'season_id': season_id, 'name': f'season {season_id}', 'total': total})
+    data['page'].update({'page_num': page_num, 'page_size': page_size, 'total': total})
+    return body
+
+
+ROUTES = {
+  '/x/web-interface/view': 'view',
+  '/x/player/playurl': 'playurl',
+  '/pgc/view/web/season': 'pgc_season',
+  '/pgc/player/web/playurl': 'pgc_playurl',
+  '/x/medialist/info': 'medialist_info',
+  '/x/v3/fav/resource/list': 'fav_resource_list',
+  '/x/polymer/web-space/seasons_archives_list': 'seasons_archives_list'
+}
+
+
+class _Server(ThreadingHTTPServer):
+  def handle_error(self, request, client_address):
+    # the parser closes connections of requests it cancelled, e.g. list pages after a failed one
+    if isinstance(sys.exc_info()[1], ConnectionError):
+      return
+    super().handle_error(request, client_address)
+
+
+class _Handler(BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+  disable_nagle_algorithm = True
+  api = None
+
+  def log_message(self, *args):
+    pass
+
+  def _send(self, status, body=b'', headers=None):
+    self.send_response(status)
+    for k, v in (headers or {}).items():
+      self.send_header(k, v)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    if body and self.command != 'HEAD':
+      self.wfile.write(body)
+
+  def do_HEAD(self):
+    self.do_GET()
+
+  def do_GET(self):
+    parts = urllib.parse.urlsplit(self.path)
+    if parts.path.startswith('/cdn'):
+      return self._cdn()
+    endpoint = ROUTES.get(parts.path)
+    self.api._count(endpoint or 'unknown')
+    time.sleep(self.api.delay())
+    if endpoint is None:
+      body = {'code': -404, 'message': '啥都木有'}
+    else:
+      body = getattr(self.api, endpoint)(dict(urllib.parse.parse_qsl(parts.query)))
+    raw = json.dumps(body, ensure_ascii=False).encode('utf-8')
+    self._send(200, raw, {'Content-Type': 'application/json; charset=utf-8'})
+
+  def _cdn(self):
+    self.api._count('cdn')
+    time.sleep(self.api.delay())
+    size = CDN_OBJECT_SIZE
+    rng = self.headers.get('Range')
+    if not rng:
+      return self._send(200, b'\0' * size, {'Content-Type': 'video/mp4'})
+    start, _, end = rng.split('=', 1)[1].partition('-')
+    start = int(start or 0)
+    end = min(int(end) if end else size - 1, size - 1)
+    headers = {'Content-Type': 'video/mp4', 'Content-Range': f'bytes {start}-{end}/{size}'}
+    self._send(206, b'\0' * (end - start + 1), headers)
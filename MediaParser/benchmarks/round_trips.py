@@ -0,0 +1,177 @@
+import json
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, BENCH_DIR)
+
+import bench  # noqa: E402
+import fake_api  # noqa: E402
+
+DEFAULT_ARCHIVE_DIR = os.path.join(BENCH_DIR, 'archives')
+BASELINE_NAME = 'baseline.json'
+
+USAGE = '''usage: round_trips.py record [--archive DIR] [--scenario NAME]... [--live]
+                              [--url NAME=URL [--batch] [--stream]]... [--cookie C]
+       round_trips.py check [--archive DIR] [--update]
+
+record runs each scenario once with BILI_HTTP_RECORD set, writing
+DIR/<scenario>.jsonl.gz and the API round trips per parse to DIR/%s.
+Without --live the bundled scenarios run against the fake API; with --live
+pass real URLs via --url (cookies are redacted from the archive).
+
+check replays every archived scenario without delays and exits 1 when a
+scenario needs more round trips than the baseline or requests something the
+archive does not contain. --update rewrites the baseline counts.''' % BASELINE_NAME
+
+
+def _baseline_path(directory):
+  return os.path.join(directory, BASELINE_NAME)
+
+
+def _load_baseline(directory):
+  try:
+    with open(_baseline_path(directory), 'r', encoding='utf-8') as f:
+      return json.load(f)
+  except FileNotFoundError:
+    return {}
+
+
+def _save_baseline(directory, baseline):
+  with open(_baseline_path(directory), 'w', encoding='utf-8') as f:
+    json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+    f.write('\n')
+
+
+def record(directory, scenarios, live=False, cookie=None):
+  os.makedirs(directory, exist_ok=True)
+  baseline = _load_baseline(directory)
+  api = None
+  if not live:
+    api = fake_api.FakeBilibiliAPI()
+    api.start()
+  try:
+    for name, scenario in scenarios.items():
+      path = bench.archive_path(directory, name)
+      if os.path.exists(path):
+        os.remove(path)
+      env = dict(os.environ)
+      env.pop('BILI_SHORT_LINK_CACHE', None)
+      env.pop('BILI_CACHE_DB', None)
+      env.pop('BILI_HTTP_REPLAY', None)
+      env['BILI_HTTP_RECORD'] = path
+      if api is not None:
+        env['BILI_API_BASE'] = api.base
+      if cookie:
+        env['BILI_BENCH_COOKIE'] = cookie
+      child = bench.run_child_process(bench.child_command(name, scenario=scenario), env)
+      url, kwargs, streaming = scenario
+      baseline[name] = {'url': url, 'kwargs': kwargs, 'stream': streaming, 'requests': child['http_requests']}
+      sys.stdout.write(f'{name}: {child["http_requests"]} round trips -> {path}\n')
+  finally:
+    if api is not None:
+      api.stop()
+  _save_baseline(directory, baseline)
+  return 0
+
+
+def check(directory, update=False):
+  baseline = _load_baseline(directory)
+  if not baseline:
+    sys.stderr.write(f'no baseline in {directory}, run "record" first\n')
+    return 2
+  failed = []
+  for name, entry in sorted(baseline.items()):
+    env = dict(os.environ)
+    env.pop('BILI_SHORT_LINK_CACHE', None)
+    env.pop('BILI_CACHE_DB', None)
+    env.pop('BILI_HTTP_RECORD', None)
+    env['BILI_HTTP_REPLAY'] = bench.archive_path(directory, name)
+    env['BILI_HTTP_REPLAY_SCALE'] = '0'
+    scenario = (entry['url'], entry.get('kwargs') or {}, bool(entry.get('stream')))
+    try:
+      child = bench.run_child_process(bench.child_command(name, scenario=scenario), env)
+    except RuntimeError as e:
+      child = {'http_requests': None, 'http_misses': None, 'error': str(e)}
+    requests = child['http_requests']
+    misses = child['http_misses']
+    status = 'ok'
+    if requests is None:
+      status = 'error: ' + child['error']
+    elif misses:
+      status = f'{misses} request(s) not in archive'
+    elif requests > entry['requests']:
+      status = f'round trips increased by {requests - entry["requests"]}'
+    elif requests < entry['requests']:
+      status = f'round trips reduced by {entry["requests"] - requests}'
+    sys.stdout.write(f'{name}: baseline {entry["requests"]}, now {requests} ({status})\n')
+    if requests is None or misses or requests > entry['requests']:
+      failed.append(name)
+    elif update:
+      entry['requests'] = requests
+  if update:
+    _save_baseline(directory, baseline)
+  return 1 if failed else 0
+
+
+def main(argv):
+  if len(argv) < 2 or argv[1] not in ('record', 'check'):
+    sys.stdout.write(USAGE + '\n')
+    return 0 if len(argv) > 1 and argv[1] in ('-h', '--help') else 2
+  mode = argv[1]
+  directory = DEFAULT_ARCHIVE_DIR
+  names = []
+  urls = {}
+  live = False
+  update = False
+  cookie = None
+  last = None
+  i = 2
+  while i < len(argv):
+    a = argv[i]
+    if a == '--archive' and i + 1 < len(argv):
+      directory = argv[i + 1]
+      i += 2
+      continue
+    if a == '--scenario' and i + 1 < len(argv):
+      names.append(argv[i + 1])
+      i += 2
+      continue
+    if a == '--url' and i + 1 < len(argv):
+      name, _, url = argv[i + 1].partition('=')
+      last = name
+      urls[name] = (url, {}, False)
+      i += 2
+      continue
+    if a == '--cookie' and i + 1 < len(argv):
+      cookie = argv[i + 1]
+      i += 2
+      continue
+    if a == '--batch' and last:
+      urls[last] = (urls[last][0], {'batch': True}, urls[last][2])
+    elif a == '--stream' and last:
+      urls[last] = (urls[last][0], urls[last][1], True)
+    elif a == '--live':
+      live = True
+    elif a == '--update':
+      update = True
+    i += 1
+
+  if mode == 'check':
+    return check(directory, update=update)
+  if live and not urls:
+    sys.stderr.write('--live needs at least one --url NAME=URL\n')
+    return 2
+  scenarios = dict(urls)
+  if not live:
+    for name in names or ([] if urls else list(bench.SCENARIOS)):
+      if name not in bench.SCENARIOS:
+        sys.stderr.write(f'unknown scenario: {name}\n')
+        return 2
+      scenarios[name] = bench.SCENARIOS[name]
+  return record(directory, scenarios, live=live, cookie=cookie)
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv))
@@ -0,0 +1,258 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PARSERS_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'parsers')
+PARSER_SCRIPT = os.path.join(PARSERS_DIR, 'bilibili_parser.py')
+
+sys.path.insert(0, BENCH_DIR)
+
+import fake_api  # noqa: E402
+
+SAMPLE_URL = 'https://www.bilibili.com/video/BV1Bench0001?p=1'
+HEAVY_MODULES = ('asyncio', 'ssl', 'http.client', 'email', 'urllib.request', 'gzip', 'hashlib', 'json', 'socket', 're')
+
+USAGE = '''usage: startup.py [--runs N] [--exe PATH] [--url URL] [--tls-host HOST[:PORT]]
+                  [--certfile PEM --keyfile PEM] [--save FILE] [--compare FILE] [--json]
+
+Measures the cold start of the parser CLI in separate processes:
+  boot      interpreter start and exit with nothing imported
+  import    importing bilibili_parser (with a -X importtime breakdown)
+  regex     compiling the parser's module-level patterns from an empty re
+            cache (paid inside import, shown separately)
+  tls       ssl.create_default_context() and one handshake (with --tls-host,
+            or against the fake API when --certfile/--keyfile are given)
+  ttfb      spawn to first byte of output of main(argv) for one parse against
+            the fake API, and spawn to exit
+
+--exe measures a frozen bilibili_parser binary instead of the source script for
+ttfb; the binary must honour BILI_API_BASE to stay offline. --save writes the
+medians as JSON and --compare prints the change against such a file, so a
+startup-optimised build can be tracked against an earlier one.'''
+
+_IMPORT_SNIPPET = '''
+import json, sys, time
+sys.path.insert(0, %r)
+started = time.perf_counter()
+import bilibili_parser
+sys.stdout.write(json.dumps(time.perf_counter() - started))
+'''
+
+# the patterns compile at import, so first use costs nothing; recompile them from a purged cache instead
+_REGEX_SNIPPET = '''
+import json, re, sys, time
+sys.path.insert(0, %r)
+import bilibili_parser as bp
+patterns = [(v.pattern, v.flags) for v in vars(bp).values() if isinstance(v, re.Pattern)]
+re.purge()
+started = time.perf_counter()
+for pattern, flags in patterns:
+  re.compile(pattern, flags)
+sys.stdout.write(json.dumps(time.perf_counter() - started))
+'''
+
+_TLS_SNIPPET = '''
+import json, socket, ssl, sys, time
+host, port, cafile = json.loads(%r)
+started = time.perf_counter()
+ctx = ssl.create_default_context()
+context = time.perf_counter() - started
+handshake = None
+if cafile:
+  ctx.load_verify_locations(cafile)
+if host:
+  sock = socket.create_connection((host, port), timeout=10)
+  started = time.perf_counter()
+  tls = ctx.wrap_socket(sock, server_hostname=host)
+  handshake = time.perf_counter() - started
+  tls.close()
+sys.stdout.write(json.dumps([context, handshake]))
+'''
+
+
+def _median_ms(values):
+  values = [v for v in values if v is not None]
+  return round(statistics.median(values) * 1000, 2) if values else None
+
+
+def _python_value(snippet, env=None):
+  out = subprocess.run([sys.executable, '-c', snippet], env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+  if out.returncode != 0:
+    raise RuntimeError(out.stderr.strip())
+  return json.loads(out.stdout.strip())
+
+
+def _spawn(cmd, env=None):
+  started = time.perf_counter()
+  proc = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+  first = proc.stdout.read(1)
+  first_byte = time.perf_counter() - started if first else None
+  proc.communicate()
+  return first_byte, time.perf_counter() - started, proc.returncode
+
+
+def measure_boot(runs):
+  return {'boot_ms': _median_ms([_spawn([sys.executable, '-c', 'pass'])[1] for _ in range(runs)])}
+
+
+def measure_import(runs):
+  samples = [_python_value(_IMPORT_SNIPPET % PARSERS_DIR) for _ in range(runs)]
+  proc = subprocess.run(
+    [sys.executable, '-X', 'importtime', '-c', f'import sys; sys.path.insert(0, {PARSERS_DIR!r}); import bilibili_parser'],
+    stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+  )
+  modules = {}
+  for line in proc.stderr.splitlines():
+    if not line.startswith('import time:') or '|' not in line:
+      continue
+    _, cumulative, name = line[len('import time:'):].split('|')
+    name = name.strip()
+    try:
+      modules[name] = int(cumulative.strip()) / 1000.0
+    except ValueError:
+      continue
+  return {
+    'import_ms': _median_ms(samples),
+    'import_breakdown_ms': {name: round(modules[name], 2) for name in HEAVY_MODULES if name in modules}
+  }
+
+
+def measure_regex(runs):
+  return {'regex_ms': _median_ms([_python_value(_REGEX_SNIPPET % PARSERS_DIR) for _ in range(runs)])}
+
+
+def measure_tls(runs, host=None, port=443, cafile=None):
+  samples = [_python_value(_TLS_SNIPPET % json.dumps([host, port, cafile])) for _ in range(runs)]
+  return {
+    'tls_context_ms': _median_ms([s[0] for s in samples]),
+    'tls_handshake_ms': _median_ms([s[1] for s in samples])
+  }
+
+
+def measure_ttfb(runs, api, url, exe=None):
+  env = dict(os.environ)
+  env['BILI_API_BASE'] = api.base
+  env.pop('BILI_SHORT_LINK_CACHE', None)
+  env.pop('BILI_CACHE_DB', None)
+  cmd = [exe, url] if exe else [sys.executable, PARSER_SCRIPT, url]
+  samples = [_spawn(cmd, env=env) for _ in range(runs)]
+  failed = [s for s in samples if s[2] != 0]
+  if failed:
+    raise RuntimeError(f'{" ".join(cmd)} exited with {failed[0][2]}')
+  return {
+    'ttfb_ms': _median_ms([s[0] for s in samples]),
+    'exit_ms': _median_ms([s[1] for s in samples])
+  }
+
+
+def _print_results(results, previous=None):
+  for key, value in results.items():
+    if isinstance(value, dict):
+      sys.stdout.write(f'{key}\n')
+      for name, ms in value.items():
+        sys.stdout.write(f'  {name:<20} {ms:>9} ms\n')
+      continue
+    line = f'{key:<22} {value if value is not None else "-":>9}'
+    old = (previous or {}).get(key)
+    if key.endswith('_ms') and isinstance(old, (int, float)) and isinstance(value, (int, float)):
+      line += f'  ({value - old:+.2f} ms vs {old})'
+    sys.stdout.write(line + '\n')
+
+
+def main(argv):
+  runs = 5
+  exe = None
+  url = SAMPLE_URL
+  tls_host = None
+  tls_port = 443
+  certfile = None
+  keyfile = None
+  save = None
+  compare = None
+  as_json = False
+  i = 1
+  while i < len(argv):
+    a = argv[i]
+    if a in ('-h', '--help'):
+      sys.stdout.write(USAGE + '\n')
+      return 0
+    if a == '--runs' and i + 1 < len(argv):
+      runs = max(1, int(argv[i + 1]))
+      i += 2
+      continue
+    if a == '--exe' and i + 1 < len(argv):
+      exe = argv[i + 1]
+      i += 2
+      continue
+    if a == '--url' and i + 1 < len(argv):
+      url = argv[i + 1]
+      i += 2
+      continue
+    if a == '--tls-host' and i + 1 < len(argv):
+      tls_host, _, port = argv[i + 1].partition(':')
+      tls_port = int(port or 443)
+      i += 2
+      continue
+    if a == '--certfile' and i + 1 < len(argv):
+      certfile = argv[i + 1]
+      i += 2
+      continue
+    if a == '--keyfile' and i + 1 < len(argv):
+      keyfile = argv[i + 1]
+      i += 2
+      continue
+    if a == '--save' and i + 1 < len(argv):
+      save = argv[i + 1]
+      i += 2
+      continue
+    if a == '--compare' and i + 1 < len(argv):
+      compare = argv[i + 1]
+      i += 2
+      continue
+    if a == '--json':
+      as_json = True
+    i += 1
+
+  results = {'label': os.path.basename(exe) if exe else 'source', 'runs': runs}
+  results.update(measure_boot(runs))
+  results.update(measure_import(runs))
+  results.update(measure_regex(runs))
+
+  api = fake_api.FakeBilibiliAPI()
+  https = None
+  api.start()
+  try:
+    cafile = None
+    if certfile and not tls_host:
+      https = fake_api.FakeBilibiliAPI(certfile=certfile, keyfile=keyfile)
+      https.start()
+      tls_host, tls_port = https.server.server_address[:2]
+      cafile = certfile
+    results.update(measure_tls(runs, tls_host, tls_port, cafile=cafile))
+    results.update(measure_ttfb(runs, api, url, exe=exe))
+  finally:
+    api.stop()
+    if https is not None:
+      https.stop()
+
+  if save:
+    with open(save, 'w', encoding='utf-8') as f:
+      json.dump(results, f, indent=2)
+      f.write('\n')
+  if as_json:
+    sys.stdout.write(json.dumps(results) + '\n')
+    return 0
+  previous = None
+  if compare:
+    with open(compare, 'r', encoding='utf-8') as f:
+      previous = json.load(f)
+  _print_results(results, previous)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv))
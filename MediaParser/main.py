@@ -1,10 +1,193 @@
-import time
+import hmac
+import json
+import os
+import secrets
+import socketserver
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-def main():
-    print("Python process started")
-    while True:
-        time.sleep(1)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parsers'))
 
-if __name__ == "__main__":
-    main()
+import bilibili_parser  # noqa: E402
+
+DEFAULT_WORKERS = 4
+
+
+def _encode_line(obj):
+  return (json.dumps(obj, ensure_ascii=False) + '\n').encode('utf-8', errors='replace')
+
+
+def _parse_kwargs(req):
+  force_single = req.get('force_single')
+  return {
+    'qn': req.get('qn'),
+    'cookie': req.get('cookie') or None,
+    'force_single': True if force_single is None else bool(force_single),
+    'pages': req.get('pages'),
+    'batch': bool(req.get('batch')),
+    'select': req.get('select'),
+    'probe_sizes': bool(req.get('probe_sizes')),
+    'rank_mirrors': bool(req.get('rank_mirrors')),
+    'policy': req.get('policy') if isinstance(req.get('policy'), dict) else None,
+    'speculative': req.get('speculative'),
+    'timings': bool(req.get('timings'))
+  }
+
+
+def _handle_request(req, token=None):
+  if not isinstance(req, dict):
+    yield {'ok': False, 'error': 'invalid request'}
+    return
+  req_id = req.get('id')
+  if token is not None and not hmac.compare_digest(str(req.get('token') or ''), token):
+    yield {'id': req_id, 'ok': False, 'error': 'unauthorized'}
+    return
+  cmd = req.get('cmd') or 'parse'
+  if cmd == 'ping':
+    yield {'id': req_id, 'ok': True, 'pong': True}
+    return
+  if cmd == 'stats':
+    yield {'id': req_id, 'ok': True, 'playurl_fallbacks': bilibili_parser.playurl_fallback_stats()}
+    return
+  if cmd != 'parse':
+    yield {'id': req_id, 'ok': False, 'error': f'unknown cmd: {cmd}'}
+    return
+  url = req.get('url')
+  if not url:
+    yield {'id': req_id, 'ok': False, 'error': 'missing url'}
+    return
+  try:
+    if req.get('stream'):
+      for record in bilibili_parser.iter_parse_bilibili(url, **_parse_kwargs(req)):
+        record['id'] = req_id
+        yield record
+      return
+    result = bilibili_parser.parse_bilibili(url, **_parse_kwargs(req))
+  except Exception as e:
+    resp = {'id': req_id, 'ok': False, 'error': str(e)}
+    if req.get('stream'):
+      resp['record'] = 'error'
+    yield resp
+    return
+  out = dict(result)
+  out['id'] = req_id
+  yield out
+
+
+def _handle_line(line, token=None):
+  line = line.strip()
+  if not line:
+    return
+  try:
+    req = json.loads(line.decode('utf-8', errors='replace') if isinstance(line, bytes) else line)
+  except Exception:
+    yield {'ok': False, 'error': 'invalid json'}
+    return
+  yield from _handle_request(req, token)
+
+
+def serve_stdio(workers=DEFAULT_WORKERS):
+  out = getattr(sys.stdout, 'buffer', sys.stdout)
+  inp = getattr(sys.stdin, 'buffer', sys.stdin)
+  lock = threading.Lock()
+
+  def respond(line):
+    for resp in _handle_line(line):
+      data = _encode_line(resp)
+      with lock:
+        out.write(data)
+        out.flush()
+
+  with ThreadPoolExecutor(max_workers=workers) as pool:
+    for line in inp:
+      pool.submit(respond, line)
+  return 0
+
+
+class _ParserRequestHandler(socketserver.StreamRequestHandler):
+  def handle(self):
+    lock = threading.Lock()
+    pool = self.server.pool
+    token = self.server.token
+
+    def respond(line):
+      for resp in _handle_line(line, token):
+        data = _encode_line(resp)
+        with lock:
+          try:
+            self.wfile.write(data)
+            self.wfile.flush()
+          except OSError:
+            return
+
+    pending = []
+    for line in self.rfile:
+      pending.append(pool.submit(respond, line))
+    for f in pending:
+      f.result()
+
+
+class _ParserServer(socketserver.ThreadingTCPServer):
+  daemon_threads = True
+  allow_reuse_address = True
+
+
+def serve_socket(host='127.0.0.1', port=0, workers=DEFAULT_WORKERS, watch_stdin=False):
+  server = _ParserServer((host, port), _ParserRequestHandler)
+  server.pool = ThreadPoolExecutor(max_workers=workers)
+  # any local process can reach the port, so requests must carry the token only the parent reads from stdout
+  server.token = secrets.token_hex(16)
+  bound_host, bound_port = server.server_address[:2]
+  sys.stdout.write(json.dumps({'event': 'ready', 'host': bound_host, 'port': bound_port, 'token': server.token}) + '\n')
+  sys.stdout.flush()
+
+  if watch_stdin:
+    def wait_parent():
+      try:
+        sys.stdin.read()
+      except Exception:
+        pass
+      server.shutdown()
+    threading.Thread(target=wait_parent, daemon=True).start()
+
+  try:
+    server.serve_forever()
+  finally:
+    server.server_close()
+    server.pool.shutdown(wait=False)
+  return 0
+
+
+def main(argv):
+  host = '127.0.0.1'
+  port = None
+  workers = DEFAULT_WORKERS
+  watch_stdin = False
+  i = 1
+  while i < len(argv):
+    a = argv[i]
+    if a == '--port' and i + 1 < len(argv):
+      port = int(argv[i + 1])
+      i += 2
+      continue
+    if a == '--host' and i + 1 < len(argv):
+      host = argv[i + 1]
+      i += 2
+      continue
+    if a == '--workers' and i + 1 < len(argv):
+      workers = max(1, int(argv[i + 1]))
+      i += 2
+      continue
+    if a == '--watch-stdin':
+      watch_stdin = True
+      i += 1
+      continue
+    i += 1
+  if port is not None:
+    return serve_socket(host=host, port=port, workers=workers, watch_stdin=watch_stdin)
+  return serve_stdio(workers=workers)
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv))
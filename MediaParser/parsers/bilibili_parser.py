@@ -1,67 +1,1226 @@
+import asyncio
+import atexit
+import collections
+import contextlib
+import contextvars
+import gzip
+import hashlib
+import itertools
 import json
 import re
+import socket
+import sqlite3
+import ssl
 import sys
+import threading
+import time
 import urllib.parse
-import urllib.request
+import weakref
+import zlib
 import os
 
 CHROME_UA = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
 
+POOL_MAX_PER_HOST = int(os.environ.get('BILI_POOL_MAX_PER_HOST') or 6)
+POOL_IDLE_TIMEOUT = float(os.environ.get('BILI_POOL_IDLE_TIMEOUT') or 60)
+MAX_REDIRECTS = 10
+FANOUT_WORKERS = int(os.environ.get('BILI_FANOUT_WORKERS') or POOL_MAX_PER_HOST)
+TIMING_LOG = os.environ.get('BILI_TIMING_LOG') or None
+API_BASE = (os.environ.get('BILI_API_BASE') or 'https://api.bilibili.com').rstrip('/')
+
+SHORT_LINK_HOSTS = ('b23.tv', 'bili2233.cn', 'bili22.cn', 'bili33.cn', 'bili23.cn')
+SHORT_LINK_CACHE_SIZE = 512
+SHORT_LINK_CACHE_PATH = os.environ.get('BILI_SHORT_LINK_CACHE') or None
+
+DISK_CACHE_PATH = os.environ.get('BILI_CACHE_DB') or None
+DISK_CACHE_MAX_ENTRIES = int(os.environ.get('BILI_CACHE_MAX_ENTRIES') or 20000)
+DISK_CACHE_MAX_BYTES = int(os.environ.get('BILI_CACHE_MAX_BYTES') or 64 * 1024 * 1024)
+DISK_CACHE_BUSY_TIMEOUT = 0.25
+DISK_CACHE_TOUCH_AFTER = 60
+DISK_CACHE_EVICT_EVERY = 64
+DISK_CACHE_URL_TTL = 7 * 86400
+DISK_CACHE_KINDS = ('view', 'bangumi', 'ugc_season')
+
+METADATA_CACHE_SIZE = 256
+METADATA_TTLS = {
+  'view': 300,
+  'bangumi': 600,
+  'media_collection': 120,
+  'media_page': 120,
+  'ugc_season': 300
+}
+
+PAGE_MAP_CACHE_SIZE = 1024
+PAGE_MAP_TTL = 86400
+
+UGC_SEASON_PAGE_SIZE = 100
+MEDIA_PAGE_SIZE = 20
+MAX_LIST_PAGES = 500
+
+PLAYURL_CACHE_SIZE = 128
+PLAYURL_EXPIRY_MARGIN = 300
+
+AUDIO_FNVAL = 16 | 256
+
+SPECULATIVE_TOP_QN = 127
+SPECULATIVE_MIN_SAMPLES = 5
+SPECULATIVE_FALLBACK_RATE = 0.2
+SPECULATIVE_PLAYURL = os.environ.get('BILI_SPECULATIVE_PLAYURL') or 'auto'
+SPECULATIVE_STATS_TTL = 30 * 86400
+
+CODEC_IDS = {'avc': 7, 'h264': 7, 'hevc': 12, 'h265': 12, 'av1': 13}
+
+SIZE_PROBE_TIMEOUT = float(os.environ.get('BILI_SIZE_PROBE_TIMEOUT') or 5)
+
+MIRROR_PROBE_BYTES = 64 * 1024
+MIRROR_PROBE_TIMEOUT = float(os.environ.get('BILI_MIRROR_PROBE_TIMEOUT') or 3)
+MIRROR_RANK_BYTES = 4 * 1024 * 1024
+MIRROR_SCORE_CACHE_SIZE = 64
+MIRROR_SCORE_TTL = float(os.environ.get('BILI_MIRROR_SCORE_TTL') or 120)
+
+HTTP_RECORD_PATH = os.environ.get('BILI_HTTP_RECORD') or None
+HTTP_REPLAY_PATH = os.environ.get('BILI_HTTP_REPLAY') or None
+HTTP_REPLAY_SCALE = float(os.environ.get('BILI_HTTP_REPLAY_SCALE') or 1)
+# blanked in archive keys: secrets, request signatures, and cdn deadlines that shift on replay
+ARCHIVE_REDACTED_PARAMS = ('access_key', 'csrf', 'sessdata', 'bili_jct', 'w_rid', 'wts', 'deadline')
+ARCHIVE_HEADERS = ('location', 'content-length', 'content-range')
+
+# one alternative per id kind; each branch has exactly one capturing group so lastgroup names the kind
+_URL_ID_RE = re.compile(
+  r'(?P<bvid>BV[0-9A-Za-z]+)'
+  r'|(?i:/bangumi/play/ep(?P<epid>\d+))'
+  r'|(?i:/bangumi/play/ss(?P<ssid>\d+))'
+  r'|(?i:/media/md(?P<media_id>\d+))'
+  r'|(?i:(?:/video/)?av(?P<aid>\d+))'
+)
+_FILENAME_SPACE_RE = re.compile(r'[\r\n\t]')
+_FILENAME_RESERVED_RE = re.compile(r'[<>:"/\\\\|?*]+')
+_FILENAME_RUNS_RE = re.compile(r'\s{2,}')
+_FILE_EXT_RE = re.compile(r'\.([A-Za-z0-9]{1,6})$')
+_SESSDATA_RE = re.compile(r'(?:^|;)\s*SESSDATA=([^;]+)')
+_CONTENT_RANGE_TOTAL_RE = re.compile(r'/(\d+)\s*$')
+_URL_DEADLINE_RE = re.compile(r'[?&]deadline=(\d+)')
+_ARCHIVE_DEADLINE_RE = re.compile(r'(deadline=)(\d+)')
+
 
 def _sanitize_filename(name):
   s = str(name or '').strip()
   if not s:
     return 'bilibili'
-  s = re.sub(r'[\r\n\t]', ' ', s)
-  s = re.sub(r'[<>:"/\\\\|?*]+', '_', s)
-  s = re.sub(r'\s{2,}', ' ', s)
+  s = _FILENAME_SPACE_RE.sub(' ', s)
+  s = _FILENAME_RESERVED_RE.sub('_', s)
+  s = _FILENAME_RUNS_RE.sub(' ', s)
   s = s.strip(' .')
   return s or 'bilibili'
 
 
-def _http_get_json(url, headers=None, timeout=15):
-  req = urllib.request.Request(url, headers=headers or {})
-  with urllib.request.urlopen(req, timeout=timeout) as resp:
-    raw = resp.read()
-  return json.loads(raw.decode('utf-8', errors='replace'))
+_TRACE = contextvars.ContextVar('bilibili_parser_trace', default=None)
+_TRACE_IDS = itertools.count(1)
+
+
+def _ms(seconds):
+  return round(seconds * 1000, 2) if seconds is not None else None
+
+
+class _Trace:
+  def __init__(self, log=None):
+    self.id = next(_TRACE_IDS)
+    self.log = log
+    self.started = time.monotonic()
+    self.phases = {}
+    self.http = []
+
+  def _emit(self, event):
+    if not self.log:
+      return
+    event['trace'] = self.id
+    line = json.dumps(event, ensure_ascii=False) + '\n'
+    if self.log == 'stderr':
+      sys.stderr.write(line)
+      sys.stderr.flush()
+      return
+    try:
+      with open(self.log, 'a', encoding='utf-8') as f:
+        f.write(line)
+    except Exception:
+      pass
+
+  def add_phase(self, name, elapsed):
+    total, count = self.phases.get(name, (0.0, 0))
+    self.phases[name] = (total + elapsed, count + 1)
+    self._emit({'event': 'phase', 'name': name, 'ms': _ms(elapsed)})
+
+  def add_http(self, method, url, status, stats):
+    parts = urllib.parse.urlsplit(url)
+    record = {
+      'method': method,
+      'host': parts.netloc,
+      'path': parts.path,
+      'status': status,
+      'reused': stats.get('reused'),
+      'queue_ms': _ms(stats.get('queue')),
+      'dns_ms': _ms(stats.get('dns')),
+      'connect_ms': _ms(stats.get('connect')),
+      'tls_ms': _ms(stats.get('tls')),
+      'ttfb_ms': _ms(stats.get('ttfb')),
+      'body_ms': _ms(stats.get('body')),
+      'total_ms': _ms(stats.get('elapsed')),
+      'bytes': stats.get('bytes')
+    }
+    self.http.append(record)
+    self._emit(dict(record, event='http'))
+
+  def summary(self):
+    return {
+      'total_ms': _ms(time.monotonic() - self.started),
+      'phases': {name: {'ms': _ms(total), 'count': count} for name, (total, count) in self.phases.items()},
+      'http_count': len(self.http),
+      'bytes': sum(r.get('bytes') or 0 for r in self.http),
+      'http': self.http
+    }
+
+
+def _start_trace(timings=False):
+  if not timings and not TIMING_LOG:
+    return None
+  log = None
+  if TIMING_LOG:
+    log = 'stderr' if TIMING_LOG.strip().lower() in ('1', 'true', 'stderr') else TIMING_LOG
+  return _Trace(log=log)
+
+
+@contextlib.contextmanager
+def _phase(name):
+  trace = _TRACE.get()
+  if trace is None:
+    yield
+    return
+  started = time.monotonic()
+  try:
+    yield
+  finally:
+    trace.add_phase(name, time.monotonic() - started)
+
+
+class _Connection:
+  def __init__(self, reader, writer):
+    self.reader = reader
+    self.writer = writer
+    self.last_used = time.monotonic()
+
+  def close(self):
+    try:
+      self.writer.close()
+    except Exception:
+      pass
+
+
+class _ConnectionPool:
+  def __init__(self, max_per_host=POOL_MAX_PER_HOST, idle_timeout=POOL_IDLE_TIMEOUT):
+    self.max_per_host = max(1, int(max_per_host))
+    self.idle_timeout = float(idle_timeout)
+    # streams and semaphores belong to the loop that created them, so the engine loop and
+    # any asyncio.run() loop of an async caller each get their own idle connections and limits
+    self._loops = weakref.WeakKeyDictionary()
+    self._ssl_context = None
+    self._proxies = None
+    self._bypass = {}
+
+  def _get_ssl_context(self):
+    if self._ssl_context is None:
+      self._ssl_context = ssl.create_default_context()
+    return self._ssl_context
+
+  def _proxy_for(self, scheme, host):
+    # same sources as urllib: *_proxy/no_proxy variables, then the system settings on Windows and macOS
+    if self._proxies is None:
+      from urllib import request
+      self._proxy_bypass = request.proxy_bypass
+      self._proxies = request.getproxies()
+    proxy = self._proxies.get(scheme)
+    if not proxy or not host:
+      return None
+    bypass = self._bypass.get(host)
+    if bypass is None:
+      try:
+        bypass = bool(self._proxy_bypass(host))
+      except Exception:
+        bypass = False
+      self._bypass[host] = bypass
+    if bypass:
+      return None
+    parts = urllib.parse.urlsplit(proxy if '://' in proxy else 'http://' + proxy)
+    if not parts.hostname:
+      return None
+    auth = None
+    if parts.username is not None:
+      import base64
+      user = urllib.parse.unquote(parts.username)
+      password = urllib.parse.unquote(parts.password or '')
+      auth = 'Basic ' + base64.b64encode(f'{user}:{password}'.encode('utf-8')).decode('ascii')
+    return {'host': parts.hostname, 'port': parts.port or 80, 'auth': auth}
+
+  def _state(self):
+    loop = asyncio.get_running_loop()
+    state = self._loops.get(loop)
+    if state is None:
+      for other in [l for l in self._loops.keys() if l.is_closed()]:
+        del self._loops[other]
+      state = self._loops[loop] = ({}, {})
+    return state
+
+  def _limit(self, key):
+    limits = self._state()[1]
+    sem = limits.get(key)
+    if sem is None:
+      sem = limits[key] = asyncio.Semaphore(self.max_per_host)
+    return sem
+
+  def _evict_expired(self, idle, now):
+    for key in list(idle.keys()):
+      alive = []
+      for conn in idle[key]:
+        if now - conn.last_used > self.idle_timeout:
+          conn.close()
+        else:
+          alive.append(conn)
+      if alive:
+        idle[key] = alive
+      else:
+        del idle[key]
+
+  def _acquire_idle(self, key):
+    idle = self._state()[0]
+    self._evict_expired(idle, time.monotonic())
+    conns = idle.get(key)
+    if conns:
+      return conns.pop()
+    return None
+
+  def _release(self, key, conn, reusable):
+    if reusable:
+      conn.last_used = time.monotonic()
+      self._state()[0].setdefault(key, []).append(conn)
+    else:
+      conn.close()
+
+  def close_all(self):
+    idle = self._state()[0]
+    for conns in idle.values():
+      for conn in conns:
+        conn.close()
+    idle.clear()
+
+  async def _open_tunnel(self, reader, writer, host, port, proxy):
+    lines = [f'CONNECT {host}:{port} HTTP/1.1', f'Host: {host}:{port}']
+    if proxy.get('auth'):
+      lines.append(f'Proxy-Authorization: {proxy["auth"]}')
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1', errors='replace'))
+    await writer.drain()
+    status_line = await reader.readline()
+    while True:
+      line = await reader.readline()
+      if line in (b'\r\n', b'\n', b''):
+        break
+    parts = status_line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+    if len(parts) < 2 or parts[1] != '200':
+      writer.close()
+      raise ConnectionError(f'proxy refused CONNECT {host}:{port}: {status_line.decode("latin-1").strip()}')
+
+  async def _start_tls(self, reader, writer, host):
+    if hasattr(writer, 'start_tls'):
+      await writer.start_tls(self._get_ssl_context(), server_hostname=host)
+      return writer
+    # before 3.11 the transport is upgraded under the existing reader by hand
+    loop = asyncio.get_running_loop()
+    protocol = writer.transport.get_protocol()
+    transport = await loop.start_tls(writer.transport, protocol, self._get_ssl_context(), server_hostname=host)
+    return asyncio.StreamWriter(transport, protocol, reader, loop)
+
+  async def _connect(self, key, stats=None, proxy=None):
+    scheme, host, port = key
+    tunnel = proxy is not None and scheme == 'https'
+    if stats is None and scheme == 'https' and not tunnel:
+      reader, writer = await asyncio.open_connection(host, port, ssl=self._get_ssl_context(), server_hostname=host)
+      return _Connection(reader, writer)
+    dial_host, dial_port = (proxy['host'], proxy['port']) if proxy else (host, port)
+    if stats is None:
+      reader, writer = await asyncio.open_connection(dial_host, dial_port)
+    else:
+      started = time.monotonic()
+      infos = await asyncio.get_running_loop().getaddrinfo(dial_host, dial_port, type=socket.SOCK_STREAM)
+      stats['dns'] = time.monotonic() - started
+      started = time.monotonic()
+      error = None
+      for family, _, _, _, addr in infos:
+        try:
+          reader, writer = await asyncio.open_connection(addr[0], addr[1], family=family)
+          break
+        except OSError as e:
+          error = e
+      else:
+        raise error or OSError(f'cannot connect to {dial_host}')
+      stats['connect'] = time.monotonic() - started
+    if tunnel:
+      await self._open_tunnel(reader, writer, host, port, proxy)
+    if scheme == 'https':
+      started = time.monotonic()
+      writer = await self._start_tls(reader, writer, host)
+      if stats is not None:
+        stats['tls'] = time.monotonic() - started
+    return _Connection(reader, writer)
+
+  async def _read_chunked(self, reader):
+    chunks = []
+    while True:
+      size_line = await reader.readline()
+      if not size_line:
+        raise ConnectionResetError('connection closed in chunked body')
+      size = int(size_line.split(b';', 1)[0].strip() or b'0', 16)
+      if size == 0:
+        while True:
+          line = await reader.readline()
+          if line in (b'\r\n', b'\n', b''):
+            break
+        return b''.join(chunks)
+      chunks.append(await reader.readexactly(size))
+      await reader.readexactly(2)
+
+  async def _exchange(self, conn, method, host_header, path, headers, read_body, max_body=None, stats=None):
+    lines = [f'{method} {path} HTTP/1.1', f'Host: {host_header}']
+    names = set()
+    for k, v in (headers or {}).items():
+      names.add(k.lower())
+      lines.append(f'{k}: {v}')
+    if 'connection' not in names:
+      lines.append('Connection: keep-alive')
+    conn.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1', errors='replace'))
+    await conn.writer.drain()
+    if stats is not None:
+      stats['sent'] = time.monotonic()
+
+    status_line = await conn.reader.readline()
+    if not status_line:
+      raise ConnectionResetError('connection closed before response')
+    if stats is not None:
+      stats['first_byte'] = time.monotonic()
+      stats['ttfb'] = stats['first_byte'] - stats['sent']
+    parts = status_line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+    if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+      raise ConnectionResetError(f'bad status line: {status_line!r}')
+    version = parts[0]
+    status = int(parts[1])
+    reason = parts[2] if len(parts) > 2 else ''
+    resp_headers = {}
+    while True:
+      line = await conn.reader.readline()
+      if line in (b'\r\n', b'\n', b''):
+        break
+      name, _, value = line.decode('latin-1').partition(':')
+      resp_headers[name.strip().lower()] = value.strip()
+
+    keep_alive = version == 'HTTP/1.1' and resp_headers.get('connection', '').lower() != 'close'
+    if not read_body:
+      return status, reason, resp_headers, b'', False
+    if max_body is not None and method != 'HEAD':
+      length = resp_headers.get('content-length')
+      if length is None or not length.isdigit() or int(length) > max_body:
+        return status, reason, resp_headers, b'', False
+    if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+      body = b''
+    elif 'chunked' in resp_headers.get('transfer-encoding', '').lower():
+      body = await self._read_chunked(conn.reader)
+    elif 'content-length' in resp_headers:
+      body = await conn.reader.readexactly(int(resp_headers['content-length']))
+    else:
+      body = await conn.reader.read()
+      keep_alive = False
+    return status, reason, resp_headers, body, keep_alive
+
+  async def request(self, method, url, headers=None, timeout=15, read_body=True, max_body=None, stats=None):
+    trace = _TRACE.get()
+    if stats is None and trace is not None:
+      stats = {}
+    if stats is not None:
+      stats['started'] = time.monotonic()
+    parts = urllib.parse.urlsplit(url)
+    scheme = (parts.scheme or 'https').lower()
+    port = parts.port or (443 if scheme == 'https' else 80)
+    key = (scheme, parts.hostname, port)
+    host_header = parts.hostname if parts.port is None else f'{parts.hostname}:{parts.port}'
+    path = parts.path or '/'
+    if parts.query:
+      path += '?' + parts.query
+    proxy = self._proxy_for(scheme, parts.hostname)
+    if proxy is not None and scheme == 'http':
+      # plain http goes through the proxy as an absolute-form request instead of a tunnel
+      path = f'http://{host_header}{path}'
+      if proxy.get('auth'):
+        headers = dict(headers or {}, **{'Proxy-Authorization': proxy['auth']})
+    async with self._limit(key):
+      if stats is not None:
+        stats['queue'] = time.monotonic() - stats['started']
+      for attempt in range(2):
+        conn = self._acquire_idle(key)
+        reused = conn is not None
+        if stats is not None:
+          stats['reused'] = reused
+        try:
+          if conn is None:
+            conn = await asyncio.wait_for(self._connect(key, stats, proxy), timeout)
+          status, reason, resp_headers, body, keep_alive = await asyncio.wait_for(
+            self._exchange(conn, method, host_header, path, headers, read_body, max_body, stats),
+            timeout
+          )
+        except asyncio.TimeoutError:
+          if conn is not None:
+            conn.close()
+          raise TimeoutError(f'timed out: {url}')
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+          if conn is not None:
+            conn.close()
+          if reused and attempt == 0:
+            continue
+          raise
+        except BaseException:
+          if conn is not None:
+            conn.close()
+          raise
+        self._release(key, conn, keep_alive)
+        if stats is not None:
+          now = time.monotonic()
+          stats['elapsed'] = now - stats['started']
+          stats['body'] = now - stats['first_byte']
+          stats['bytes'] = len(body)
+          if trace is not None:
+            trace.add_http(method, url, status, stats)
+        return status, reason, resp_headers, body
+
+
+class _Engine:
+  def __init__(self):
+    self._loop = None
+    self._thread = None
+    self._lock = threading.Lock()
+
+  def loop(self):
+    with self._lock:
+      if self._loop is None:
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, name='bilibili-parser-engine', daemon=True)
+        thread.start()
+        self._loop = loop
+        self._thread = thread
+      return self._loop
+
+  def run(self, coro):
+    loop = self.loop()
+    if threading.current_thread() is self._thread:
+      coro.close()
+      raise RuntimeError('blocking parser call from inside the engine loop; await the async API instead')
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+  def iterate(self, agen):
+    try:
+      while True:
+        try:
+          item = self.run(_anext(agen))
+        except StopAsyncIteration:
+          return
+        yield item
+    finally:
+      self.run(agen.aclose())
+
+
+async def _anext(agen):
+  return await agen.__anext__()
+
+
+async def _gather_bounded(func, items, limit=FANOUT_WORKERS):
+  sem = asyncio.Semaphore(max(1, int(limit)))
+
+  async def run(item):
+    async with sem:
+      return await func(item)
 
+  return await asyncio.gather(*[run(item) for item in items], return_exceptions=True)
 
-def _resolve_redirect(url, timeout=15):
-  req = urllib.request.Request(url, headers={'User-Agent': CHROME_UA})
-  opener = urllib.request.build_opener(urllib.request.HTTPRedirectHandler)
-  with opener.open(req, timeout=timeout) as resp:
-    return resp.geturl()
+
+async def _iter_bounded(func, items, max_workers=FANOUT_WORKERS):
+  items = list(items)
+  if not items:
+    return
+  sem = asyncio.Semaphore(max(1, int(max_workers)))
+
+  async def run(idx, item):
+    async with sem:
+      try:
+        return idx, await func(item), None
+      except Exception as e:
+        return idx, None, e
+
+  tasks = [asyncio.ensure_future(run(idx, item)) for idx, item in enumerate(items)]
+  try:
+    for future in asyncio.as_completed(tasks):
+      yield await future
+  finally:
+    for task in tasks:
+      if not task.done():
+        task.cancel()
+
+
+def _archive_key(url, headers=None):
+  headers = headers or {}
+  parts = urllib.parse.urlsplit(url)
+  query = []
+  for k, v in urllib.parse.parse_qsl(parts.query, keep_blank_values=True):
+    query.append((k, '-' if k.lower() in ARCHIVE_REDACTED_PARAMS else v))
+  # anonymous and logged-in responses differ, and so do size and mirror probes of one url
+  key = _session_key(headers.get('Cookie')) + ' ' + parts.path + '?' + urllib.parse.urlencode(sorted(query))
+  if headers.get('Range'):
+    key += ' ' + headers['Range']
+  return key
+
+
+def _cookie_secrets(headers):
+  cookie = (headers or {}).get('Cookie') or ''
+  secrets = []
+  for part in cookie.split(';'):
+    value = part.partition('=')[2].strip()
+    if len(value) >= 8:
+      secrets.append(value)
+  return secrets
+
+
+class _PoolTransport:
+  def __init__(self, pool):
+    self.pool = pool
+    self.requests = 0
+
+  async def request(self, method, url, headers=None, timeout=15, read_body=True, max_body=None, stats=None):
+    self.requests += 1
+    return await self.pool.request(method, url, headers=headers, timeout=timeout, read_body=read_body, max_body=max_body, stats=stats)
+
+  async def get(self, url, headers=None, timeout=15):
+    status, reason, _, raw = await self.request('GET', url, headers=headers, timeout=timeout)
+    return status, reason, raw
+
+
+class _RecordingTransport:
+  def __init__(self, inner, path):
+    self.inner = inner
+    self.path = path
+    self._lock = threading.Lock()
+    self._file = None
+
+  @property
+  def requests(self):
+    return self.inner.requests
+
+  def _append(self, entry):
+    line = json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n'
+    with self._lock:
+      if self._file is None:
+        # one gzip member per recording; a member per line costs more than the line itself
+        self._file = gzip.open(self.path, 'at', encoding='utf-8')
+        atexit.register(self.close)
+      self._file.write(line)
+
+  def close(self):
+    with self._lock:
+      if self._file is not None:
+        self._file.close()
+        self._file = None
+
+  async def request(self, method, url, headers=None, timeout=15, read_body=True, max_body=None, stats=None):
+    started = time.monotonic()
+    if stats is None:
+      stats = {}
+    status, reason, resp_headers, raw = await self.inner.request(
+      method, url, headers=headers, timeout=timeout, read_body=read_body, max_body=max_body, stats=stats
+    )
+    entry = {
+      'k': _archive_key(url, headers),
+      's': status,
+      'r': reason,
+      't': round(time.monotonic() - started, 4),
+      'at': int(time.time()),
+      'auth': bool((headers or {}).get('Cookie')),
+      'h': {k: v for k, v in resp_headers.items() if k in ARCHIVE_HEADERS}
+    }
+    if read_body and max_body is None:
+      body = raw.decode('utf-8', errors='replace')
+      for secret in _cookie_secrets(headers):
+        body = body.replace(secret, 'REDACTED')
+      entry['b'] = body
+    else:
+      # probe bodies are media bytes; only their size and transfer time matter
+      entry['n'] = len(raw)
+      if stats.get('body') is not None:
+        entry['tb'] = round(stats['body'], 4)
+    try:
+      await asyncio.get_running_loop().run_in_executor(None, self._append, entry)
+    except Exception:
+      pass
+    return status, reason, resp_headers, raw
+
+  async def get(self, url, headers=None, timeout=15):
+    status, reason, _, raw = await self.request('GET', url, headers=headers, timeout=timeout)
+    return status, reason, raw
+
+
+class _ReplayTransport:
+  def __init__(self, path, scale=1.0):
+    self.path = path
+    self.scale = scale
+    self.requests = 0
+    self.misses = 0
+    self._entries = None
+
+  def _load(self):
+    entries = {}
+    with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+      for line in f:
+        line = line.strip()
+        if line:
+          entry = json.loads(line)
+          entries.setdefault(entry['k'], collections.deque()).append(entry)
+    self._entries = entries
+
+  def _next(self, key):
+    queue = self._entries.get(key)
+    if not queue:
+      return None
+    # repeats past the end of the recording replay the last response
+    return queue.popleft() if len(queue) > 1 else queue[0]
+
+  async def request(self, method, url, headers=None, timeout=15, read_body=True, max_body=None, stats=None):
+    if self._entries is None:
+      self._load()
+    self.requests += 1
+    key = _archive_key(url, headers)
+    entry = self._next(key)
+    if entry is None:
+      self.misses += 1
+      raise ValueError(f'no recorded response for {key}')
+    elapsed = (entry.get('t') or 0) * self.scale
+    if elapsed > 0:
+      await asyncio.sleep(elapsed)
+    if 'b' in entry:
+      # keep recorded playurl deadlines as far in the future as they were at record time
+      offset = int(time.time()) - int(entry.get('at') or time.time())
+      body = _ARCHIVE_DEADLINE_RE.sub(lambda m: m.group(1) + str(int(m.group(2)) + offset), entry['b']).encode('utf-8')
+    else:
+      body = b'\0' * (entry.get('n') or 0)
+    if stats is not None:
+      stats['elapsed'] = elapsed
+      stats['body'] = (entry.get('tb') or 0) * self.scale
+      stats['bytes'] = len(body)
+    return entry['s'], entry.get('r') or '', dict(entry.get('h') or {}), body
+
+  async def get(self, url, headers=None, timeout=15):
+    status, reason, _, raw = await self.request('GET', url, headers=headers, timeout=timeout)
+    return status, reason, raw
+
+
+_POOL = _ConnectionPool()
+_ENGINE = _Engine()
+
+
+def _default_transport():
+  if HTTP_REPLAY_PATH:
+    return _ReplayTransport(HTTP_REPLAY_PATH, scale=HTTP_REPLAY_SCALE)
+  transport = _PoolTransport(_POOL)
+  if HTTP_RECORD_PATH:
+    transport = _RecordingTransport(transport, HTTP_RECORD_PATH)
+  return transport
+
+
+_TRANSPORT = _default_transport()
+
+
+def set_http_transport(transport):
+  global _TRANSPORT
+  previous = _TRANSPORT
+  _TRANSPORT = transport or _default_transport()
+  return previous
+
+
+async def _http_get_json(url, headers=None, timeout=15):
+  status, reason, raw = await _TRANSPORT.get(url, headers=headers, timeout=timeout)
+  if status >= 400:
+    raise ValueError(f'HTTP Error {status}: {reason}')
+  with _phase('decode'):
+    return json.loads(raw.decode('utf-8', errors='replace'))
+
+
+def _session_key(cookie):
+  m = _SESSDATA_RE.search(str(cookie or ''))
+  if not m:
+    return 'anon'
+  return 'u:' + hashlib.sha1(m.group(1).strip().encode('utf-8')).hexdigest()[:16]
+
+
+def _api_ok(payload):
+  code = (payload or {}).get('code')
+  return code is not None and str(code) == '0'
+
+
+def _disk_key(*parts):
+  return ':'.join(str(p) for p in parts)
+
+
+def _remember_json(kind, ident, session, payload, ttl, persist=True):
+  keys = [ident]
+  data = payload.get('data') or {}
+  if kind == 'view':
+    cids = [p.get('cid') for p in data.get('pages') or []]
+    for key in (f"bvid:{data.get('bvid')}" if data.get('bvid') else None, f"aid:{data.get('aid')}" if data.get('aid') else None):
+      if key and all(cids):
+        _PAGE_MAPS.set(key, cids, PAGE_MAP_TTL)
+    if data.get('bvid'):
+      keys.append(f"bvid:{data.get('bvid')}")
+    if data.get('aid'):
+      keys.append(f"aid:{data.get('aid')}")
+  elif kind == 'bangumi':
+    season_id = (payload.get('result') or data).get('season_id')
+    if season_id:
+      keys.append(f'ss:{season_id}')
+  for key in dict.fromkeys(keys):
+    _METADATA_CACHE.set((kind, key, session), payload, ttl)
+    if persist and kind in DISK_CACHE_KINDS:
+      _DISK_CACHE.set_later(_disk_key('meta', kind, key, session), payload, ttl)
+
+
+async def _cached_get_json(kind, ident, url, headers, cookie):
+  session = _session_key(cookie)
+  cached = _METADATA_CACHE.get((kind, ident, session))
+  if cached is not None:
+    return cached
+  if kind in DISK_CACHE_KINDS:
+    cached, ttl = await _DISK_CACHE.get_async(_disk_key('meta', kind, ident, session))
+    if cached is not None:
+      _remember_json(kind, ident, session, cached, ttl, persist=False)
+      return cached
+  payload = await _http_get_json(url, headers=headers)
+  if _api_ok(payload):
+    _remember_json(kind, ident, session, payload, METADATA_TTLS.get(kind))
+  return payload
+
+
+def _dash_audio_streams(dash):
+  streams = list(dash.get('audio') or [])
+  for extra in ('dolby', 'flac'):
+    block = dash.get(extra)
+    if isinstance(block, dict):
+      audio = block.get('audio')
+      if isinstance(audio, dict):
+        streams.append(audio)
+      elif isinstance(audio, list):
+        streams.extend(audio)
+  return streams
+
+
+def _iter_play_urls(p_data):
+  for item in p_data.get('durl') or []:
+    yield item.get('url')
+    for u in item.get('backup_url') or []:
+      yield u
+  dash = p_data.get('dash')
+  if not isinstance(dash, dict):
+    return
+  streams = list(dash.get('video') or []) + _dash_audio_streams(dash)
+  for stream in streams:
+    yield stream.get('baseUrl') or stream.get('base_url')
+    for u in stream.get('backupUrl') or stream.get('backup_url') or []:
+      yield u
+
+
+def _playurl_deadline(p_data):
+  deadline = None
+  for u in _iter_play_urls(p_data):
+    m = _URL_DEADLINE_RE.search(u or '')
+    if not m:
+      continue
+    value = int(m.group(1))
+    if deadline is None or value < deadline:
+      deadline = value
+  return deadline
+
+
+async def _cached_get_playurl(key, url, headers, cookie):
+  key = key + (_session_key(cookie),)
+  cached = _PLAYURL_CACHE.get(key)
+  if cached is not None:
+    return cached
+  cached, ttl = await _DISK_CACHE.get_async(_disk_key('play', *key))
+  if cached is not None:
+    _PLAYURL_CACHE.set(key, cached, ttl)
+    return cached
+  payload = await _http_get_json(url, headers=headers)
+  if _api_ok(payload):
+    p_data = payload.get('data') or payload.get('result') or {}
+    if p_data.get('durl') or p_data.get('dash'):
+      deadline = _playurl_deadline(p_data)
+      if deadline is not None:
+        ttl = deadline - PLAYURL_EXPIRY_MARGIN - time.time()
+        _PLAYURL_CACHE.set(key, payload, ttl)
+        _DISK_CACHE.set_later(_disk_key('play', *key), payload, ttl)
+  return payload
+
+
+async def _resolve_redirect(url, timeout=15):
+  current = url
+  for _ in range(MAX_REDIRECTS):
+    status, reason, resp_headers, _ = await _TRANSPORT.request('GET', current, headers={'User-Agent': CHROME_UA}, timeout=timeout, read_body=False)
+    location = resp_headers.get('location')
+    if status in (301, 302, 303, 307, 308) and location:
+      current = urllib.parse.urljoin(current, location)
+      # the ids are all that is needed, so a bilibili.com page is not fetched
+      if _classify_url(current) == 'canonical':
+        return current
+      continue
+    if status >= 400:
+      raise ValueError(f'HTTP Error {status}: {reason}')
+    return current
+  raise ValueError('too many redirects')
+
+
+class _LRUCache:
+  def __init__(self, maxsize, path=None):
+    self.maxsize = max(1, int(maxsize))
+    self.path = path
+    self._data = collections.OrderedDict()
+    self._lock = threading.Lock()
+    self._save_lock = threading.Lock()
+    self._loaded = path is None
+    self._dirty = False
+    self._flush_pending = False
+
+  def _load(self):
+    self._loaded = True
+    try:
+      with open(self.path, 'r', encoding='utf-8') as f:
+        items = json.load(f)
+    except Exception:
+      return
+    if isinstance(items, list):
+      for item in items[-self.maxsize:]:
+        if isinstance(item, list) and len(item) == 2:
+          self._data[item[0]] = item[1]
+
+  def _save(self, items):
+    tmp = f'{self.path}.{os.getpid()}.tmp'
+    try:
+      with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(items, f, ensure_ascii=False)
+      os.replace(tmp, self.path)
+    except Exception:
+      try:
+        os.remove(tmp)
+      except Exception:
+        pass
+
+  def get(self, key):
+    with self._lock:
+      if not self._loaded:
+        self._load()
+      if key not in self._data:
+        return None
+      self._data.move_to_end(key)
+      return self._data[key]
+
+  def set(self, key, value):
+    # only marks the file dirty; flush() or set_later() writes it
+    with self._lock:
+      if not self._loaded:
+        self._load()
+      self._data[key] = value
+      self._data.move_to_end(key)
+      while len(self._data) > self.maxsize:
+        self._data.popitem(last=False)
+      self._dirty = self.path is not None
+
+  def flush(self):
+    with self._save_lock:
+      with self._lock:
+        self._flush_pending = False
+        if not self._dirty:
+          return
+        self._dirty = False
+        items = [[k, v] for k, v in self._data.items()]
+      self._save(items)
+
+  def set_later(self, key, value):
+    # the file is rewritten in the executor; sets made before that write runs share it
+    self.set(key, value)
+    with self._lock:
+      if not self._dirty or self._flush_pending:
+        return
+      self._flush_pending = True
+    asyncio.get_running_loop().run_in_executor(None, self.flush)
+
+
+class _TTLCache:
+  def __init__(self, maxsize):
+    self.maxsize = max(1, int(maxsize))
+    self._data = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    with self._lock:
+      entry = self._data.get(key)
+      if entry is None:
+        return None
+      expires_at, value = entry
+      if expires_at <= time.time():
+        del self._data[key]
+        return None
+      self._data.move_to_end(key)
+      return value
+
+  def set(self, key, value, ttl):
+    if ttl is None or ttl <= 0:
+      return
+    with self._lock:
+      self._data[key] = (time.time() + ttl, value)
+      self._data.move_to_end(key)
+      while len(self._data) > self.maxsize:
+        self._data.popitem(last=False)
+
+  def clear(self):
+    with self._lock:
+      self._data.clear()
+
+
+class _DiskCache:
+  # shared by the daemon and CLI processes; payloads are zlib-compressed compact json
+  SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS entries ('
+    'key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, '
+    'expires REAL NOT NULL, accessed REAL NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires)',
+    'CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)'
+  )
+
+  def __init__(self, path, max_entries=DISK_CACHE_MAX_ENTRIES, max_bytes=DISK_CACHE_MAX_BYTES):
+    self.path = path
+    self.max_entries = max(1, int(max_entries))
+    self.max_bytes = max(1, int(max_bytes))
+    self._conn = None
+    self._disabled = not path
+    self._writes = 0
+    self._touched = {}
+    self._lock = threading.Lock()
+
+  def _connect(self):
+    if self._conn is None and not self._disabled:
+      conn = None
+      try:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=DISK_CACHE_BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in self.SCHEMA:
+          conn.execute(statement)
+        self._conn = conn
+      except sqlite3.OperationalError:
+        # another process holds the lock; try again on the next call
+        if conn is not None:
+          conn.close()
+      except Exception:
+        self._disabled = True
+    return self._conn
+
+  def get(self, key):
+    # read-only: expired rows are left to _evict and access times are written with the next set
+    with self._lock:
+      conn = self._connect()
+      if conn is None:
+        return None, 0
+      now = time.time()
+      try:
+        row = conn.execute('SELECT value, expires, accessed FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is None:
+          return None, 0
+        value, expires, accessed = row
+        if expires <= now:
+          return None, 0
+        if now - accessed > DISK_CACHE_TOUCH_AFTER:
+          self._touched[key] = now
+        return json.loads(zlib.decompress(value).decode('utf-8')), expires - now
+      except Exception:
+        # a busy database is a miss rather than a stall
+        return None, 0
+
+  def _encode(self, value):
+    return zlib.compress(json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+  def _write(self, key, blob, ttl):
+    with self._lock:
+      conn = self._connect()
+      if conn is None:
+        return
+      try:
+        now = time.time()
+        with conn:
+          conn.execute('BEGIN')
+          if self._touched:
+            conn.executemany('UPDATE entries SET accessed = ? WHERE key = ?', [(t, k) for k, t in self._touched.items()])
+            self._touched.clear()
+          conn.execute(
+            'INSERT OR REPLACE INTO entries (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)',
+            (key, blob, len(blob), now + ttl, now)
+          )
+          self._writes += 1
+          if self._writes % DISK_CACHE_EVICT_EVERY == 1:
+            self._evict(conn, now)
+      except Exception:
+        pass
+
+  def set(self, key, value, ttl):
+    if ttl is None or ttl <= 0 or self._disabled:
+      return
+    try:
+      blob = self._encode(value)
+    except Exception:
+      return
+    self._write(key, blob, ttl)
+
+  async def get_async(self, key):
+    if self._disabled:
+      return None, 0
+    return await asyncio.get_running_loop().run_in_executor(None, self.get, key)
+
+  def _update(self, key, update, ttl):
+    with self._lock:
+      conn = self._connect()
+      if conn is None:
+        return
+      try:
+        now = time.time()
+        with conn:
+          # IMMEDIATE takes the write lock before the read so concurrent processes do not lose updates
+          conn.execute('BEGIN IMMEDIATE')
+          row = conn.execute('SELECT value, expires FROM entries WHERE key = ?', (key,)).fetchone()
+          current = json.loads(zlib.decompress(row[0]).decode('utf-8')) if row and row[1] > now else None
+          blob = self._encode(update(current))
+          conn.execute(
+            'INSERT OR REPLACE INTO entries (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)',
+            (key, blob, len(blob), now + ttl, now)
+          )
+      except Exception:
+        pass
+
+  def update_later(self, key, update, ttl):
+    if ttl is None or ttl <= 0 or self._disabled:
+      return
+    asyncio.get_running_loop().run_in_executor(None, self._update, key, update, ttl)
+
+  def set_later(self, key, value, ttl):
+    # encoded on the loop so later changes to the payload cannot race the write, which is not awaited
+    if ttl is None or ttl <= 0 or self._disabled:
+      return
+    try:
+      blob = self._encode(value)
+    except Exception:
+      return
+    asyncio.get_running_loop().run_in_executor(None, self._write, key, blob, ttl)
+
+  def _evict(self, conn, now):
+    conn.execute('DELETE FROM entries WHERE expires <= ?', (now,))
+    count, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+    if count <= self.max_entries and size <= self.max_bytes:
+      return
+    # drop the least recently used tenth beyond the limits so eviction is not re-run on every write
+    excess = max(count - self.max_entries, 0)
+    if size > self.max_bytes:
+      excess = max(excess, int(count * (1 - self.max_bytes / float(size))) + 1)
+    excess += self.max_entries // 10
+    conn.execute('DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed LIMIT ?)', (excess,))
+
+  def clear(self):
+    with self._lock:
+      conn = self._connect()
+      if conn is not None:
+        try:
+          conn.execute('DELETE FROM entries')
+        except Exception:
+          pass
+
+
+_SHORT_LINKS = _LRUCache(SHORT_LINK_CACHE_SIZE, path=SHORT_LINK_CACHE_PATH)
+_DISK_CACHE = _DiskCache(DISK_CACHE_PATH)
+_METADATA_CACHE = _TTLCache(METADATA_CACHE_SIZE)
+_PLAYURL_CACHE = _TTLCache(PLAYURL_CACHE_SIZE)
+_MIRROR_SCORES = _TTLCache(MIRROR_SCORE_CACHE_SIZE)
+_PAGE_MAPS = _TTLCache(PAGE_MAP_CACHE_SIZE)
+
+
+def _classify_url(url):
+  s = str(url or '').strip()
+  parts = urllib.parse.urlsplit(s if '://' in s else 'https://' + s)
+  host = (parts.hostname or '').lower()
+  if host in SHORT_LINK_HOSTS or any(host.endswith('.' + h) for h in SHORT_LINK_HOSTS):
+    return 'short'
+  if host == 'bilibili.com' or host.endswith('.bilibili.com'):
+    if any(_extract_ids(s)):
+      return 'canonical'
+  return 'unknown'
+
+
+async def _resolve_url(url, timeout=15):
+  kind = _classify_url(url)
+  if kind == 'canonical':
+    return url
+  key = str(url or '').strip()
+  if '://' not in key:
+    key = 'https://' + key
+  if kind == 'short':
+    cached = _SHORT_LINKS.get(key)
+    if cached:
+      return cached
+    cached, _ = await _DISK_CACHE.get_async(f'url:{key}')
+    if cached:
+      _SHORT_LINKS.set_later(key, cached)
+      return cached
+  final_url = await _resolve_redirect(key, timeout=timeout)
+  if kind == 'short':
+    _SHORT_LINKS.set_later(key, final_url)
+    _DISK_CACHE.set_later(f'url:{key}', final_url, DISK_CACHE_URL_TTL)
+  return final_url
 
 
 def _extract_ids(url):
-  s = str(url or '')
-  bvid = None
-  aid = None
-  epid = None
-  ssid = None
-  media_id = None
+  found = {}
+  for m in _URL_ID_RE.finditer(str(url or '')):
+    found.setdefault(m.lastgroup, m.group(m.lastgroup))
+  return found.get('bvid'), found.get('aid'), found.get('epid'), found.get('ssid'), found.get('media_id')
 
-  m_bv = re.search(r'(BV[0-9A-Za-z]+)', s)
-  if m_bv:
-    bvid = m_bv.group(1)
 
-  m_av = re.search(r'(?:/video/)?av(\d+)', s, re.IGNORECASE)
-  if m_av:
-    aid = m_av.group(1)
+def _page_index(url):
+  query = urllib.parse.parse_qs(urllib.parse.urlsplit(str(url or '')).query)
+  try:
+    index = int((query.get('p') or [''])[0])
+  except ValueError:
+    return None
+  return index if index > 0 else None
 
-  m_ep = re.search(r'/bangumi/play/ep(\d+)', s, re.IGNORECASE)
-  if m_ep:
-    epid = m_ep.group(1)
 
-  m_ss = re.search(r'/bangumi/play/ss(\d+)', s, re.IGNORECASE)
-  if m_ss:
-    ssid = m_ss.group(1)
+def _page_cid(pages, index):
+  if index and index <= len(pages):
+    return pages[index - 1].get('cid')
+  return pages[0].get('cid') if pages else None
 
-  m_media = re.search(r'/media/md(\d+)', s, re.IGNORECASE)
-  if m_media:
-    media_id = m_media.group(1)
 
-  return bvid, aid, epid, ssid, media_id
+def _known_cid(bvid, aid, index):
+  cids = _PAGE_MAPS.get(f'bvid:{bvid}') if bvid else None
+  if cids is None and aid:
+    cids = _PAGE_MAPS.get(f'aid:{aid}')
+  if not cids:
+    return None
+  return cids[index - 1] if index and index <= len(cids) else cids[0]
 
 
 def _build_referer(bvid=None, aid=None):
@@ -72,23 +1231,26 @@ def _build_referer(bvid=None, aid=None):
   return 'https://www.bilibili.com/'
 
 
-def _get_view_info(bvid=None, aid=None, cookie=None):
+async def _get_view_info(bvid=None, aid=None, cookie=None):
   if bvid:
-    u = f'https://api.bilibili.com/x/web-interface/view?bvid={urllib.parse.quote(bvid)}'
+    u = f'{API_BASE}/x/web-interface/view?bvid={urllib.parse.quote(bvid)}'
+    ident = f'bvid:{bvid}'
   elif aid:
-    u = f'https://api.bilibili.com/x/web-interface/view?aid={urllib.parse.quote(str(aid))}'
+    u = f'{API_BASE}/x/web-interface/view?aid={urllib.parse.quote(str(aid))}'
+    ident = f'aid:{aid}'
   else:
     raise ValueError('missing video id')
   headers = {'User-Agent': CHROME_UA, 'Referer': 'https://www.bilibili.com/'}
   if cookie:
     headers['Cookie'] = cookie
-  return _http_get_json(u, headers=headers)
+  with _phase('view'):
+    return await _cached_get_json('view', ident, u, headers, cookie)
 
 
-def _get_playurl(bvid=None, aid=None, cid=None, qn=None, cookie=None, fnval=None):
+async def _get_playurl(bvid=None, aid=None, cid=None, qn=None, cookie=None, fnval=None):
   if not cid:
     raise ValueError('missing cid')
-  base = 'https://api.bilibili.com/x/player/playurl'
+  base = f'{API_BASE}/x/player/playurl'
   effective_qn = str(qn) if qn is not None and str(qn).strip() else '0'
   effective_fnval = str(fnval) if fnval is not None else '4048'
   qs = {'cid': str(cid), 'qn': effective_qn, 'fnval': effective_fnval, 'fourk': '1', 'platform': 'pc'}
@@ -102,24 +1264,29 @@ def _get_playurl(bvid=None, aid=None, cid=None, qn=None, cookie=None, fnval=None
   headers = {'User-Agent': CHROME_UA, 'Referer': 'https://www.bilibili.com/'}
   if cookie:
     headers['Cookie'] = cookie
-  return _http_get_json(u, headers=headers)
+  key = ('ugc', bvid or f'av{aid}', str(cid), effective_qn, effective_fnval)
+  with _phase('playurl'):
+    return await _cached_get_playurl(key, u, headers, cookie)
 
 
-def _get_bangumi_info(epid=None, ssid=None, cookie=None):
+async def _get_bangumi_info(epid=None, ssid=None, cookie=None):
   if epid:
-    u = f'https://api.bilibili.com/pgc/view/web/season?ep_id={urllib.parse.quote(str(epid))}'
+    u = f'{API_BASE}/pgc/view/web/season?ep_id={urllib.parse.quote(str(epid))}'
+    ident = f'ep:{epid}'
   elif ssid:
-    u = f'https://api.bilibili.com/pgc/view/web/season?season_id={urllib.parse.quote(str(ssid))}'
+    u = f'{API_BASE}/pgc/view/web/season?season_id={urllib.parse.quote(str(ssid))}'
+    ident = f'ss:{ssid}'
   else:
     raise ValueError('missing epid or ssid')
   headers = {'User-Agent': CHROME_UA, 'Referer': 'https://www.bilibili.com/'}
   if cookie:
     headers['Cookie'] = cookie
-  return _http_get_json(u, headers=headers)
+  with _phase('season'):
+    return await _cached_get_json('bangumi', ident, u, headers, cookie)
 
 
-def _get_bangumi_playurl(epid, cid, qn=None, cookie=None, fnval=None):
-  base = 'https://api.bilibili.com/pgc/player/web/playurl'
+async def _get_bangumi_playurl(epid, cid, qn=None, cookie=None, fnval=None):
+  base = f'{API_BASE}/pgc/player/web/playurl'
   effective_qn = str(qn) if qn is not None and str(qn).strip() else '0'
   effective_fnval = str(fnval) if fnval is not None else '4048'
   qs = {'ep_id': str(epid), 'cid': str(cid), 'qn': effective_qn, 'fnval': effective_fnval, 'fourk': '1'}
@@ -127,36 +1294,166 @@ def _get_bangumi_playurl(epid, cid, qn=None, cookie=None, fnval=None):
   headers = {'User-Agent': CHROME_UA, 'Referer': 'https://www.bilibili.com/'}
   if cookie:
     headers['Cookie'] = cookie
-  return _http_get_json(u, headers=headers)
+  key = ('pgc', str(epid), str(cid), effective_qn, effective_fnval)
+  with _phase('playurl'):
+    return await _cached_get_playurl(key, u, headers, cookie)
+
+
+async def _get_media_collection_info(media_id, cookie=None):
+  u = f'{API_BASE}/x/medialist/info?media_id={urllib.parse.quote(str(media_id))}'
+  headers = {'User-Agent': CHROME_UA, 'Referer': 'https://www.bilibili.com/'}
+  if cookie:
+    headers['Cookie'] = cookie
+  with _phase('collection'):
+    return await _cached_get_json('media_collection', str(media_id), u, headers, cookie)
 
 
-def _get_media_collection_info(media_id, cookie=None):
-  u = f'https://api.bilibili.com/x/medialist/info?media_id={urllib.parse.quote(str(media_id))}'
+async def _get_media_collection_page(media_id, pn, cookie=None, ps=MEDIA_PAGE_SIZE):
+  qs = {'media_id': str(media_id), 'pn': str(pn), 'ps': str(ps), 'platform': 'web'}
+  u = f'{API_BASE}/x/v3/fav/resource/list?' + urllib.parse.urlencode(qs)
   headers = {'User-Agent': CHROME_UA, 'Referer': 'https://www.bilibili.com/'}
   if cookie:
     headers['Cookie'] = cookie
-  return _http_get_json(u, headers=headers)
+  with _phase('collection'):
+    return await _cached_get_json('media_page', f'{media_id}:{pn}:{ps}', u, headers, cookie)
 
 
-def _get_ugc_season_info(season_id, cookie=None):
-  u = f'https://api.bilibili.com/x/polymer/web-space/seasons_archives_list?mid=0&season_id={urllib.parse.quote(str(season_id))}&sort_reverse=false&page_num=1&page_size=100'
+async def _get_ugc_season_info(season_id, cookie=None, page_num=1, page_size=UGC_SEASON_PAGE_SIZE):
+  qs = {'mid': '0', 'season_id': str(season_id), 'sort_reverse': 'false', 'page_num': str(page_num), 'page_size': str(page_size)}
+  u = f'{API_BASE}/x/polymer/web-space/seasons_archives_list?' + urllib.parse.urlencode(qs)
   headers = {'User-Agent': CHROME_UA, 'Referer': 'https://www.bilibili.com/'}
   if cookie:
     headers['Cookie'] = cookie
-  return _http_get_json(u, headers=headers)
+  with _phase('collection'):
+    return await _cached_get_json('ugc_season', f'{season_id}:{page_num}:{page_size}', u, headers, cookie)
+
+
+async def _iter_list_pages(fetch_page, total, page_size, first_items, max_workers=FANOUT_WORKERS):
+  yield first_items
+  try:
+    page_count = -(-int(total) // int(page_size))
+  except (TypeError, ValueError, ZeroDivisionError):
+    return
+  page_count = min(page_count, MAX_LIST_PAGES)
+  if page_count <= 1:
+    return
+  sem = asyncio.Semaphore(max(1, int(max_workers)))
+
+  async def run(pn):
+    async with sem:
+      return await fetch_page(pn)
+
+  tasks = [asyncio.ensure_future(run(pn)) for pn in range(2, page_count + 1)]
+  try:
+    for task in tasks:
+      items = await task
+      if not items:
+        break
+      yield items
+  finally:
+    for task in tasks:
+      if not task.done():
+        task.cancel()
+
+
+def _api_list_page(payload, *keys):
+  code = (payload or {}).get('code')
+  if code is not None and str(code) != '0':
+    raise ValueError(str((payload or {}).get('message') or code))
+  data = (payload or {}).get('data') or {}
+  for key in keys:
+    if data.get(key):
+      return data.get(key)
+  return []
+
+
+async def _iter_ugc_season_archives(season_id, s_data, cookie, errors=None):
+  # as with favlists, a failed page ends the listing and is reported in errors
+  errors = [] if errors is None else errors
+  first = s_data.get('archives') or []
+  page = s_data.get('page') or {}
+  total = page.get('total') or len(first)
+  page_size = page.get('page_size') or UGC_SEASON_PAGE_SIZE
+
+  async def fetch_page(pn):
+    try:
+      return _api_list_page(await _get_ugc_season_info(season_id, cookie=cookie, page_num=pn, page_size=page_size), 'archives')
+    except Exception as e:
+      errors.append({'page': pn, 'error': str(e)})
+      return []
+
+  async for items in _iter_list_pages(fetch_page, total, page_size, first):
+    for item in items:
+      yield item
+
+
+async def _iter_media_collection_items(media_id, c_data, cookie, errors=None):
+  # a page that fails ends the listing; what was listed so far is kept and the page goes to errors
+  errors = [] if errors is None else errors
+  media_list = c_data.get('media_list') or []
+  total = c_data.get('media_count')
+  # the inline list may be truncated, so it is only trusted against a known count
+  if media_list and total and len(media_list) >= int(total):
+    for item in media_list:
+      yield item
+    return
+  try:
+    first_page = await _get_media_collection_page(media_id, 1, cookie=cookie)
+    first = _api_list_page(first_page, 'medias')
+  except Exception as e:
+    errors.append({'page': 1, 'error': str(e)})
+    for item in media_list:
+      yield item
+    return
+  first_data = (first_page or {}).get('data') or {}
+  total = (first_data.get('info') or {}).get('media_count') or total
+
+  async def fetch_page(pn):
+    try:
+      return _api_list_page(await _get_media_collection_page(media_id, pn, cookie=cookie), 'medias')
+    except Exception as e:
+      errors.append({'page': pn, 'error': str(e)})
+      return []
+
+  if total:
+    async for items in _iter_list_pages(fetch_page, total, MEDIA_PAGE_SIZE, first):
+      for item in items:
+        yield item
+    return
+
+  # no count anywhere: page one at a time until has_more is false or a page comes back empty
+  items = first
+  has_more = first_data.get('has_more')
+  pn = 1
+  while items:
+    for item in items:
+      yield item
+    if has_more is False or pn >= MAX_LIST_PAGES:
+      return
+    pn += 1
+    try:
+      payload = await _get_media_collection_page(media_id, pn, cookie=cookie)
+      items = _api_list_page(payload, 'medias')
+    except Exception as e:
+      errors.append({'page': pn, 'error': str(e)})
+      return
+    has_more = ((payload or {}).get('data') or {}).get('has_more')
 
 
-def _get_video_collection_info(bvid=None, aid=None, cookie=None):
+async def _get_video_collection_info(bvid=None, aid=None, cookie=None):
   if bvid:
-    u = f'https://api.bilibili.com/x/web-interface/view?bvid={urllib.parse.quote(bvid)}'
+    u = f'{API_BASE}/x/web-interface/view?bvid={urllib.parse.quote(bvid)}'
+    ident = f'bvid:{bvid}'
   elif aid:
-    u = f'https://api.bilibili.com/x/web-interface/view?aid={urllib.parse.quote(str(aid))}'
+    u = f'{API_BASE}/x/web-interface/view?aid={urllib.parse.quote(str(aid))}'
+    ident = f'aid:{aid}'
   else:
     raise ValueError('missing video id')
   headers = {'User-Agent': CHROME_UA, 'Referer': 'https://www.bilibili.com/'}
   if cookie:
     headers['Cookie'] = cookie
-  return _http_get_json(u, headers=headers)
+  with _phase('view'):
+    return await _cached_get_json('view', ident, u, headers, cookie)
 
 
 def _format_duration(seconds):
@@ -174,176 +1471,907 @@ def _format_duration(seconds):
   return f'{m:d}:{sec:02d}'
 
 
-def _extract_dash_resources(dash, qn, title, referer):
+def _selection_policy(codecs=None, prefer=None, max_bitrate=None, audio_only=False, throughput=None, budget_seconds=None):
+  if isinstance(codecs, str):
+    codecs = codecs.split(',')
+  codec_ids = []
+  for c in codecs or []:
+    name = str(c).strip().lower()
+    codec_id = CODEC_IDS.get(name) or _parse_qn(name)
+    if codec_id and codec_id not in codec_ids:
+      codec_ids.append(codec_id)
+  prefer = str(prefer or 'quality').strip().lower()
+  if prefer not in ('quality', 'smallest'):
+    raise ValueError(f'invalid prefer: {prefer}')
+  try:
+    throughput = float(throughput) if throughput else None
+    budget_seconds = float(budget_seconds) if budget_seconds else None
+  except (TypeError, ValueError):
+    raise ValueError('invalid time budget')
+  return {
+    'codecs': codec_ids,
+    'prefer': prefer,
+    'max_bitrate': _parse_qn(max_bitrate),
+    'audio_only': bool(audio_only),
+    'throughput': throughput if throughput and throughput > 0 else None,
+    'budget_seconds': budget_seconds if budget_seconds and budget_seconds > 0 else None
+  }
+
+
+def _bandwidth(stream):
+  return _parse_qn(stream.get('bandwidth')) or 0
+
+
+def _index_dash_video(video_list):
+  index = {}
+  for v in video_list:
+    vid = _parse_qn(v.get('id'))
+    if not vid:
+      continue
+    index.setdefault(vid, {}).setdefault(_parse_qn(v.get('codecid')) or 0, []).append(v)
+  return index
+
+
+def _codec_groups(by_codec, codecs):
+  groups = [by_codec[c] for c in codecs if by_codec.get(c)]
+  rest = [v for c, group in by_codec.items() if c not in codecs for v in group]
+  if rest:
+    groups.append(rest)
+  return groups
+
+
+def _select_dash_video(index, qn, policy, cap=None):
+  ids = sorted(index.keys(), reverse=True)
+  if not ids:
+    return None
+  target = _select_dash_qn(ids, qn)
+  pick = min if policy.get('prefer') == 'smallest' else max
+  for vid in [target] + [x for x in ids if x < target]:
+    for group in _codec_groups(index[vid], policy.get('codecs') or []):
+      fits = [v for v in group if not cap or _bandwidth(v) <= cap]
+      if fits:
+        return pick(fits, key=_bandwidth)
+  return min((v for by_codec in index.values() for group in by_codec.values() for v in group), key=_bandwidth)
+
+
+def _budget_bits(policy, duration):
+  if not (policy.get('throughput') and policy.get('budget_seconds') and duration):
+    return None
+  return policy.get('throughput') * 8 * policy.get('budget_seconds')
+
+
+def _select_dash_streams(dash, qn, policy=None):
+  policy = policy or _selection_policy()
+  duration = dash.get('duration')
+  audio_list = _dash_audio_streams(dash) if policy.get('audio_only') else dash.get('audio') or []
+  audio = max(audio_list, key=_bandwidth) if audio_list else None
+  cap = policy.get('max_bitrate')
+  budget_bits = _budget_bits(policy, duration)
+  if budget_bits is not None:
+    if audio and _bandwidth(audio) * duration > budget_bits:
+      audio = min(audio_list, key=_bandwidth)
+    audio_bits = _bandwidth(audio) * duration if audio else 0
+    video_cap = max(int((budget_bits - audio_bits) / duration), 1)
+    cap = min(cap, video_cap) if cap else video_cap
+  video = None
+  if not policy.get('audio_only'):
+    video = _select_dash_video(_index_dash_video(dash.get('video') or []), _parse_qn(qn), policy, cap)
+  return video, audio
+
+
+def _predict_transfer(resources, p_data, opts=None):
+  policy = (opts or {}).get('policy') or {}
+  duration = _stream_duration(p_data)
+  size = 0
+  for r in resources:
+    if r.get('size'):
+      size += r.get('size')
+    elif r.get('bandwidth') and duration:
+      size += int(r.get('bandwidth') * float(duration) / 8)
+  if not size:
+    return None
+  predicted = {'size': size}
+  if policy.get('throughput'):
+    predicted['seconds'] = round(size / policy.get('throughput'), 1)
+    if policy.get('budget_seconds'):
+      predicted['fits_budget'] = predicted['seconds'] <= policy.get('budget_seconds')
+  return predicted
+
+
+def _extract_dash_resources(dash, qn, title, referer, policy=None):
   resources = []
   total_size = 0
-  
-  video_list = dash.get('video') or []
-  audio_list = dash.get('audio') or []
-  
-  target_qn = 0
-  if qn and str(qn).strip():
-    try:
-      target_qn = int(qn)
-    except:
-      pass
-      
-  # Select Video
-  selected_video = None
-  if target_qn > 0:
-    # Try to find exact match first
-    candidates = [v for v in video_list if int(v.get('id', 0)) == target_qn]
-    if candidates:
-      # Sort by bandwidth (higher bandwidth usually means better quality)
-      candidates.sort(key=lambda x: int(x.get('bandwidth', 0)), reverse=True)
-      selected_video = candidates[0]
-    else:
-      # If exact match not found, try to find closest higher quality first
-      higher_qualities = [v for v in video_list if int(v.get('id', 0)) >= target_qn]
-      if higher_qualities:
-        # Sort by quality ID first, then bandwidth
-        higher_qualities.sort(key=lambda x: (int(x.get('id', 0)), int(x.get('bandwidth', 0))), reverse=True)
-        selected_video = higher_qualities[0]
-      else:
-        # If no higher quality available, find closest lower quality
-        lower_qualities = [v for v in video_list if int(v.get('id', 0)) <= target_qn]
-        if lower_qualities:
-          lower_qualities.sort(key=lambda x: (int(x.get('id', 0)), int(x.get('bandwidth', 0))), reverse=True)
-          selected_video = lower_qualities[0]
-      
-  if not selected_video and video_list:
-    # Fallback to highest available quality
-    video_list.sort(key=lambda x: (int(x.get('id', 0)), int(x.get('bandwidth', 0))), reverse=True)
-    selected_video = video_list[0]
-    
-  # Select Audio
-  selected_audio = None
-  if audio_list:
-    audio_list.sort(key=lambda x: int(x.get('bandwidth', 0)), reverse=True)
-    selected_audio = audio_list[0]
-    
+  selected_video, selected_audio = _select_dash_streams(dash, qn, policy)
+
   if selected_video:
     base_url = selected_video.get('baseUrl') or selected_video.get('base_url')
     if base_url:
-      size = 0
-      # Try to get size from bandwidth/duration if not explicit? 
-      # Usually DASH doesn't give explicit file size in the manifest easily without segment calculation,
-      # but Bilibili often puts it in 'size' field? No, DASH standard doesn't require it.
-      # But sometimes Bilibili API returns it?
-      # Actually, let's check keys.
-      # Assuming 'bandwidth' * 'duration' / 8 approx?
-      # Or maybe just 0.
-      
-      # Use codecid to guess extension?
-      codecid = selected_video.get('codecid')
-      # 7=AVC, 12=HEVC, 13=AV1?
-      ext = '.mp4'
-      
       resources.append({
         'url': base_url,
         'name': f"{title}_video.mp4",
         'referer': referer,
         'user_agent': CHROME_UA,
-        'size': 0 
+        'size': 0,
+        'bandwidth': _bandwidth(selected_video),
+        'qn': _parse_qn(selected_video.get('id')),
+        'codecid': _parse_qn(selected_video.get('codecid')),
+        'mirrors': _backup_urls(selected_video, base_url)
+      })
+
+  if selected_audio:
+    base_url = selected_audio.get('baseUrl') or selected_audio.get('base_url')
+    if base_url:
+      resources.append({
+        'url': base_url,
+        'name': f"{title}_audio.m4a",
+        'referer': referer,
+        'user_agent': CHROME_UA,
+        'size': 0,
+        'bandwidth': _bandwidth(selected_audio),
+        'mirrors': _backup_urls(selected_audio, base_url)
       })
 
-  if selected_audio:
-    base_url = selected_audio.get('baseUrl') or selected_audio.get('base_url')
-    if base_url:
-      resources.append({
-        'url': base_url,
-        'name': f"{title}_audio.m4a",
-        'referer': referer,
-        'user_agent': CHROME_UA,
-        'size': 0
-      })
-      
-  return resources, total_size
+  return resources, total_size
+
+
+def _backup_urls(stream, primary):
+  urls = []
+  for u in stream.get('backupUrl') or stream.get('backup_url') or []:
+    if u and u != primary and u not in urls:
+      urls.append(u)
+  return urls
+
+
+def _parse_qn(qn):
+  if qn is not None and str(qn).strip():
+    try:
+      return int(str(qn).strip())
+    except Exception:
+      return None
+  return None
+
+
+def _dash_video_ids(dash):
+  ids = []
+  if isinstance(dash, dict):
+    for v in dash.get('video') or []:
+      try:
+        vid = int(v.get('id', 0))
+      except Exception:
+        continue
+      if vid > 0:
+        ids.append(vid)
+  return sorted(set(ids), reverse=True)
+
+
+def _select_dash_qn(available_dash_ids, requested_qn_int):
+  if not available_dash_ids:
+    return None
+  if requested_qn_int is None:
+    return available_dash_ids[0]
+  if requested_qn_int in available_dash_ids:
+    return requested_qn_int
+  higher = [x for x in available_dash_ids if x >= requested_qn_int]
+  if higher:
+    return higher[0]
+  lower = [x for x in available_dash_ids if x <= requested_qn_int]
+  if lower:
+    return lower[0]
+  return available_dash_ids[0]
+
+
+def _extract_durl_resources(durl, title, referer):
+  resources = []
+  total_size = 0
+  for idx, item in enumerate(durl):
+    u = item.get('url')
+    if not u:
+      continue
+    path = urllib.parse.urlparse(u).path or ''
+    ext = ''
+    m_ext = _FILE_EXT_RE.search(path)
+    if m_ext:
+      ext = '.' + m_ext.group(1)
+    else:
+      ext = '.mp4'
+    name = title + ext if len(durl) == 1 else f'{title}.part{idx + 1}{ext}'
+    size = item.get('size')
+    try:
+      size_int = int(size) if size is not None else 0
+    except Exception:
+      size_int = 0
+    if size_int > 0:
+      total_size += size_int
+    resources.append({
+      'url': u,
+      'name': name,
+      'referer': referer,
+      'user_agent': CHROME_UA,
+      'size': size_int,
+      'mirrors': _backup_urls(item, u)
+    })
+  return resources, total_size
+
+
+def _build_stream_resources(p_data, qn, title, referer, policy=None):
+  durl = p_data.get('durl') or []
+  dash = p_data.get('dash')
+  available_dash_ids = [] if (policy or {}).get('audio_only') else _dash_video_ids(dash)
+  requested_qn_int = _parse_qn(qn)
+  selected_qn_int = _select_dash_qn(available_dash_ids, requested_qn_int)
+
+  resources = []
+  total_size = 0
+  if dash:
+    resources, total_size = _extract_dash_resources(dash, requested_qn_int, title, referer, policy)
+    selected_qn_int = next((r.get('qn') for r in resources if r.get('qn')), None)
+  elif durl:
+    resources, total_size = _extract_durl_resources(durl, title, referer)
+  return resources, total_size, available_dash_ids, requested_qn_int, selected_qn_int
+
+
+async def _probe_size(url, referer, timeout=SIZE_PROBE_TIMEOUT):
+  headers = {'User-Agent': CHROME_UA, 'Referer': referer or 'https://www.bilibili.com/', 'Range': 'bytes=0-0'}
+  status, reason, resp_headers, _ = await _TRANSPORT.request('GET', url, headers=headers, timeout=timeout, max_body=1)
+  if status == 206:
+    m = _CONTENT_RANGE_TOTAL_RE.search(resp_headers.get('content-range', ''))
+    if m:
+      return int(m.group(1))
+  elif status == 200 and (resp_headers.get('content-length') or '').isdigit():
+    return int(resp_headers['content-length'])
+  raise ValueError(f'HTTP Error {status}: {reason}')
+
+
+def _stream_duration(p_data):
+  dash = p_data.get('dash')
+  if isinstance(dash, dict) and dash.get('duration'):
+    return dash.get('duration')
+  if p_data.get('timelength'):
+    return p_data.get('timelength') / 1000
+  return None
+
+
+async def _probe_resource_sizes(resources, duration):
+  pending = [r for r in resources if not r.get('size')]
+  sizes = await _gather_bounded(lambda r: _probe_size(r.get('url'), r.get('referer')), pending)
+  for resource, size in zip(pending, sizes):
+    if isinstance(size, int) and size > 0:
+      resource['size'] = size
+      resource['size_source'] = 'probe'
+    elif resource.get('bandwidth') and duration:
+      resource['size'] = int(resource.get('bandwidth') * float(duration) / 8)
+      resource['size_source'] = 'estimate'
+
+
+def _url_host(url):
+  return urllib.parse.urlsplit(str(url or '')).netloc.lower()
+
+
+async def _probe_mirror(url, referer, timeout=MIRROR_PROBE_TIMEOUT):
+  headers = {'User-Agent': CHROME_UA, 'Referer': referer or 'https://www.bilibili.com/', 'Range': f'bytes=0-{MIRROR_PROBE_BYTES - 1}'}
+  stats = {}
+  status, reason, _, body = await _TRANSPORT.request('GET', url, headers=headers, timeout=timeout, max_body=MIRROR_PROBE_BYTES, stats=stats)
+  if status >= 400:
+    raise ValueError(f'HTTP Error {status}: {reason}')
+  transfer = max(stats['body'], 0.001)
+  return {'ok': True, 'ttfb': stats['elapsed'] - stats['body'], 'throughput': len(body) / transfer if body else 0}
+
+
+def _mirror_cost(score):
+  if not score or not score.get('ok'):
+    return float('inf')
+  throughput = score.get('throughput') or 0
+  if throughput <= 0:
+    return score.get('ttfb') + MIRROR_PROBE_TIMEOUT
+  return score.get('ttfb') + MIRROR_RANK_BYTES / throughput
+
+
+async def _rank_mirrors(resources):
+  probes = {}
+  for r in resources:
+    for u in [r.get('url')] + list(r.get('mirrors') or []):
+      host = _url_host(u)
+      if u and host not in probes and _MIRROR_SCORES.get(host) is None:
+        probes[host] = (u, r.get('referer'))
+  hosts = list(probes.keys())
+  scores = await _gather_bounded(lambda host: _probe_mirror(*probes[host]), hosts)
+  for host, score in zip(hosts, scores):
+    if not isinstance(score, dict):
+      score = {'ok': False}
+    _MIRROR_SCORES.set(host, score, MIRROR_SCORE_TTL)
+  for r in resources:
+    urls = [u for u in [r.get('url')] + list(r.get('mirrors') or []) if u]
+    if len(urls) < 2:
+      continue
+    ranked = sorted(urls, key=lambda u: _mirror_cost(_MIRROR_SCORES.get(_url_host(u))))
+    r['url'] = ranked[0]
+    r['mirrors'] = ranked[1:]
+
+
+def _resource_urls(resource):
+  urls = []
+  for u in [resource.get('url')] + list(resource.get('mirrors') or []):
+    if u and u not in urls:
+      urls.append(u)
+  healthy = [u for u in urls if (_MIRROR_SCORES.get(_url_host(u)) or {}).get('ok', True)]
+  return healthy or urls[:1]
+
+
+async def _build_resources(p_data, qn, title, referer, opts=None):
+  opts = opts or {}
+  resources, total_size, available_dash_ids, requested_qn_int, selected_qn_int = _build_stream_resources(p_data, qn, title, referer, opts.get('policy'))
+  if resources and opts.get('rank_mirrors'):
+    with _phase('mirror_probe'):
+      await _rank_mirrors(resources)
+  for r in resources:
+    r['urls'] = _resource_urls(r)
+  if resources and opts.get('probe_sizes'):
+    with _phase('size_probe'):
+      await _probe_resource_sizes(resources, _stream_duration(p_data))
+    total_size = sum(r.get('size') or 0 for r in resources)
+  return resources, total_size, available_dash_ids, requested_qn_int, selected_qn_int
+
+
+def _speculative_setting(value):
+  if value is None:
+    value = SPECULATIVE_PLAYURL
+  if isinstance(value, bool):
+    return value
+  s = str(value).strip().lower()
+  if s in ('1', 'true', 'on', 'yes'):
+    return True
+  if s in ('0', 'false', 'off', 'no'):
+    return False
+  return None
+
+
+def _stream_opts(probe_sizes=False, rank_mirrors=False, policy=None, speculative=None):
+  policy = policy or {}
+  return {
+    'probe_sizes': bool(probe_sizes),
+    'rank_mirrors': bool(rank_mirrors),
+    'speculative': _speculative_setting(speculative),
+    'policy': _selection_policy(
+      codecs=policy.get('codecs'),
+      prefer=policy.get('prefer'),
+      max_bitrate=policy.get('max_bitrate'),
+      audio_only=policy.get('audio_only'),
+      throughput=policy.get('throughput'),
+      budget_seconds=policy.get('budget_seconds')
+    )
+  }
+
+
+def _add_fallback(counts, fell_back):
+  total, fallbacks = counts if isinstance(counts, list) and len(counts) == 2 else (0, 0)
+  return [int(total) + 1, int(fallbacks) + (1 if fell_back else 0)]
+
+
+class _FallbackStats:
+  # counts are shared through the disk cache so one-shot CLI processes reach SPECULATIVE_MIN_SAMPLES too
+  def __init__(self, store=None):
+    self._counts = {}
+    self._loaded = set()
+    self._store = store
+    self._lock = threading.Lock()
+
+  async def load(self, kind):
+    if self._store is None or kind in self._loaded:
+      return
+    stored, _ = await self._store.get_async(_disk_key('fallbacks', kind))
+    with self._lock:
+      if kind in self._loaded:
+        return
+      self._loaded.add(kind)
+      if isinstance(stored, list) and len(stored) == 2:
+        total, fallbacks = self._counts.get(kind, (0, 0))
+        self._counts[kind] = (total + int(stored[0]), fallbacks + int(stored[1]))
+
+  def record(self, kind, fell_back):
+    with self._lock:
+      total, fallbacks = self._counts.get(kind, (0, 0))
+      self._counts[kind] = (total + 1, fallbacks + (1 if fell_back else 0))
+      persist = kind in self._loaded
+    if persist:
+      self._store.update_later(_disk_key('fallbacks', kind), lambda counts: _add_fallback(counts, fell_back), SPECULATIVE_STATS_TTL)
+
+  def rate(self, kind):
+    with self._lock:
+      total, fallbacks = self._counts.get(kind, (0, 0))
+    if total < SPECULATIVE_MIN_SAMPLES:
+      return None
+    return fallbacks / total
+
+  def snapshot(self):
+    with self._lock:
+      return {kind: {'total': total, 'fallbacks': fallbacks} for kind, (total, fallbacks) in self._counts.items()}
+
+
+_PLAYURL_FALLBACKS = _FallbackStats(_DISK_CACHE)
+
+
+def playurl_fallback_stats():
+  return _PLAYURL_FALLBACKS.snapshot()
+
+
+def _play_data(payload):
+  return (payload or {}).get('data') or (payload or {}).get('result') or {}
+
+
+def _play_usable(payload):
+  p_data = _play_data(payload)
+  return _api_ok(payload) and bool(p_data.get('durl') or p_data.get('dash'))
+
+
+def _qn_unset(qn):
+  return qn is None or (not str(qn).strip()) or str(qn).strip() == '0'
+
+
+def _use_speculative(kind, speculative):
+  if speculative is not None:
+    return bool(speculative)
+  rate = _PLAYURL_FALLBACKS.rate(kind)
+  return rate is not None and rate >= SPECULATIVE_FALLBACK_RATE
+
+
+def _record_default_play(kind, task):
+  if task.cancelled() or task.exception() is not None:
+    return
+  _PLAYURL_FALLBACKS.record(kind, not _play_usable(task.result()))
+
+
+async def _race_playurl(kind, fetch, top_qn):
+  default = asyncio.ensure_future(fetch(None))
+  # the default request is left to finish when top wins, otherwise racing would stop feeding the counts that enable it
+  default.add_done_callback(lambda t: _record_default_play(kind, t))
+  top = asyncio.ensure_future(fetch(top_qn))
+  pending = {default, top}
+  answers = {}
+  try:
+    while pending:
+      done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+      for task in done:
+        if task.exception() is not None:
+          continue
+        payload = task.result()
+        if _play_usable(payload):
+          return payload
+        answers[task] = payload
+    if default in answers:
+      return answers[default]
+    if top in answers:
+      return answers[top]
+    return await default
+  finally:
+    if not top.done():
+      top.cancel()
+
+
+async def _fetch_play(kind, fetch, qn, top_qn=None, speculative=None, support_formats=None):
+  if _qn_unset(qn):
+    await _PLAYURL_FALLBACKS.load(kind)
+  race = _qn_unset(qn) and top_qn and _use_speculative(kind, speculative)
+  play = await (_race_playurl(kind, fetch, top_qn) if race else fetch(qn))
+  play_code = (play or {}).get('code')
+  play_message = (play or {}).get('message')
+  p_data = _play_data(play)
+  if play_code is not None and str(play_code) != '0':
+    raise ValueError(str(play_message or play_code))
+
+  accept_quality = p_data.get('accept_quality') or []
+  accept_desc = p_data.get('accept_description') or []
+
+  if not accept_quality and support_formats:
+    accept_quality = [fmt.get('quality') for fmt in support_formats if fmt.get('quality')]
+    accept_desc = [fmt.get('new_description') or fmt.get('description') for fmt in support_formats]
+
+  durl = p_data.get('durl') or []
+  dash = p_data.get('dash')
+
+  if _qn_unset(qn) and not race:
+    _PLAYURL_FALLBACKS.record(kind, (not durl) and (not dash))
+  if (not durl) and (not dash) and accept_quality and _qn_unset(qn):
+    play = await fetch(accept_quality[0])
+    p_data = _play_data(play)
+
+  return {
+    'play_code': play_code,
+    'play_message': play_message,
+    'p_data': p_data,
+    'accept_quality': accept_quality,
+    'accept_description': accept_desc
+  }
+
+
+def _start_play(bvid, aid, cid, qn, cookie, opts):
+  if not cid:
+    return None
+  task = asyncio.ensure_future(_fetch_ugc_play(bvid, aid, cid, qn, cookie, None, _audio_only(opts), (opts or {}).get('speculative')))
+  task.add_done_callback(lambda t: t.cancelled() or t.exception())
+  return task
+
+
+def _cancel_play(task):
+  if task is not None and not task.done():
+    task.cancel()
+
+
+async def _await_play(task, known_cid, cid, support_formats):
+  if task is None:
+    return None
+  if str(known_cid) != str(cid):
+    task.cancel()
+    return None
+  # a failed speculative fetch is a miss; the caller refetches with the confirmed cid
+  await asyncio.wait((task,))
+  if task.cancelled() or task.exception() is not None:
+    return None
+  play = task.result()
+  if not play['accept_quality'] and support_formats:
+    play['accept_quality'] = [fmt.get('quality') for fmt in support_formats if fmt.get('quality')]
+    play['accept_description'] = [fmt.get('new_description') or fmt.get('description') for fmt in support_formats]
+  return play
+
+
+def _audio_only(opts):
+  return bool(((opts or {}).get('policy') or {}).get('audio_only'))
+
+
+async def _fetch_ugc_play(bvid, aid, cid, qn, cookie, support_formats=None, audio_only=False, speculative=None):
+  if audio_only:
+    play = await _get_playurl(bvid=bvid, aid=aid, cid=cid, cookie=cookie, fnval=AUDIO_FNVAL)
+    return _audio_play(play)
+
+  async def fetch(q):
+    return await _get_playurl(bvid=bvid, aid=aid, cid=cid, qn=q, cookie=cookie)
+
+  top_qn = max([_parse_qn(fmt.get('quality')) or 0 for fmt in support_formats or []] or [0]) or SPECULATIVE_TOP_QN
+  return await _fetch_play('ugc', fetch, qn, top_qn, speculative, support_formats)
+
+
+def _parse_selection(spec, total):
+  if isinstance(spec, (list, tuple)):
+    parts = [str(x) for x in spec]
+  else:
+    s = str(spec or '').strip().lower()
+    if s in ('', 'all', '*'):
+      return list(range(1, total + 1))
+    parts = s.split(',')
+  selected = []
+  for part in parts:
+    part = part.strip()
+    if not part:
+      continue
+    try:
+      if '-' in part:
+        start, end = part.split('-', 1)
+        start = int(start) if start.strip() else 1
+        end = int(end) if end.strip() else total
+        values = range(start, end + 1)
+      else:
+        values = [int(part)]
+    except ValueError:
+      raise ValueError(f'invalid selection: {part}')
+    for v in values:
+      if 1 <= v <= total and v not in selected:
+        selected.append(v)
+  if not selected:
+    raise ValueError('empty selection')
+  return selected
+
+
+async def _resolve_video_page(bvid, aid, page, qn, cookie, title, referer, support_formats, opts=None):
+  index = page.get('page')
+  cid = page.get('cid')
+  if not cid:
+    raise ValueError('missing cid')
+  part = _sanitize_filename(page.get('part') or '') if page.get('part') else ''
+  page_title = _sanitize_filename(f'{title}_P{index}_{part}' if part else f'{title}_P{index}')
+  play = await _fetch_ugc_play(bvid, aid, cid, qn, cookie, support_formats, _audio_only(opts), (opts or {}).get('speculative'))
+  resources, total_size, _, _, selected_qn_int = await _build_resources(play['p_data'], qn, page_title, referer, opts)
+  if not resources:
+    raise ValueError('no playurl')
+  duration = page.get('duration')
+  return {
+    'ok': True,
+    'page': index,
+    'cid': cid,
+    'part': part,
+    'title': page_title,
+    'duration': duration,
+    'duration_text': _format_duration(duration),
+    'total_size': total_size if total_size > 0 else None,
+    'predicted': _predict_transfer(resources, play['p_data'], opts),
+    'selected_qn': selected_qn_int,
+    'resources': resources
+  }
+
+
+async def _iter_video_pages(bvid, aid, targets, qn, cookie, title, referer, support_formats, opts=None):
+  async for idx, result, err in _iter_bounded(
+    lambda page: _resolve_video_page(bvid, aid, page, qn, cookie, title, referer, support_formats, opts),
+    targets
+  ):
+    if err is not None:
+      yield {'ok': False, 'page': targets[idx].get('page'), 'cid': targets[idx].get('cid'), 'error': str(err)}
+    else:
+      yield result
+
+
+async def _parse_video_pages(final_url, bvid, aid, data, selection, qn, cookie, stream=False, opts=None):
+  title = _sanitize_filename(data.get('title') or '')
+  all_pages = data.get('pages') or []
+  if not all_pages:
+    raise ValueError('no pages')
+  if not bvid:
+    bvid = data.get('bvid') or bvid
+  if not aid:
+    aid = data.get('aid') or aid
+  referer = _build_referer(bvid=bvid, aid=aid)
+  support_formats = data.get('support_formats') or []
+
+  selected = _parse_selection(selection, len(all_pages))
+  targets = [all_pages[i - 1] for i in selected]
+
+  owner_name = None
+  owner = data.get('owner') or {}
+  if isinstance(owner, dict) and owner.get('name'):
+    owner_name = str(owner.get('name'))
+  qualities = []
+  for fmt in support_formats:
+    try:
+      qn_int = int(fmt.get('quality'))
+    except Exception:
+      continue
+    desc = fmt.get('new_description') or fmt.get('description') or None
+    if desc is not None:
+      desc = str(desc).strip() or None
+    qualities.append({'qn': qn_int, 'desc': desc})
+  qualities.sort(key=lambda item: item.get('qn') or 0, reverse=True)
+
+  result = {
+    'ok': True,
+    'type': 'multipage',
+    'title': title,
+    'owner': owner_name,
+    'duration': data.get('duration'),
+    'duration_text': _format_duration(data.get('duration')),
+    'total_size': None,
+    'qualities': qualities,
+    'bvid': bvid,
+    'aid': aid,
+    'referer': referer,
+    'total_pages': len(all_pages),
+    'debug': {
+      'requested_qn': _parse_qn(qn),
+      'selected_pages': selected,
+      'final_url': final_url,
+      'has_cookie': True if cookie else False,
+      'has_sessdata': True if (cookie and ('SESSDATA=' in cookie)) else False
+    }
+  }
+  items = _iter_video_pages(bvid, aid, targets, qn, cookie, title, referer, support_formats, opts)
+  if stream:
+    result['_items'] = items
+    return result
+
+  order = {str(page.get('cid')): idx for idx, page in enumerate(targets)}
+  results = sorted([item async for item in items], key=lambda item: order.get(str(item.get('cid')), 0))
+  total_size = sum(r.get('total_size') or 0 for r in results if r.get('ok'))
+  result['total_size'] = total_size if total_size > 0 else None
+  result['pages'] = results
+  result['debug']['errors'] = [{'page': r.get('page'), 'error': r.get('error')} for r in results if not r.get('ok')]
+  return result
+
+
+async def _resolve_collection_video(video, qn, cookie, opts=None):
+  bvid = video.get('bvid')
+  aid = video.get('aid')
+  known_cid = video.get('cid') or _known_cid(bvid, aid, None)
+  play_task = _start_play(bvid, aid, known_cid, qn, cookie, opts)
+  try:
+    view = await _get_view_info(bvid=bvid, aid=aid, cookie=cookie)
+    view_code = (view or {}).get('code')
+    view_message = (view or {}).get('message')
+    data = (view or {}).get('data') or {}
+    if view_code is not None and str(view_code) != '0':
+      raise ValueError(str(view_message or view_code))
+
+    pages = data.get('pages') or []
+    if not pages:
+      raise ValueError('no pages')
+    cid = pages[0].get('cid')
+    if not cid:
+      raise ValueError('missing cid')
+    if not bvid:
+      bvid = data.get('bvid') or bvid
+    if not aid:
+      aid = data.get('aid') or aid
+
+    title = video.get('title') or _sanitize_filename(data.get('title') or '')
+    referer = _build_referer(bvid=bvid, aid=aid)
+    play = await _await_play(play_task, known_cid, cid, data.get('support_formats') or [])
+  finally:
+    _cancel_play(play_task)
+  if play is None:
+    play = await _fetch_ugc_play(bvid, aid, cid, qn, cookie, data.get('support_formats') or [], _audio_only(opts), (opts or {}).get('speculative'))
+  resources, total_size, _, _, selected_qn_int = await _build_resources(play['p_data'], qn, title, referer, opts)
+  if not resources:
+    raise ValueError('no playurl')
+  duration = video.get('duration') if video.get('duration') is not None else data.get('duration')
+  return {
+    'ok': True,
+    'index': video.get('index'),
+    'bvid': bvid,
+    'aid': aid,
+    'cid': cid,
+    'title': title,
+    'duration': duration,
+    'duration_text': _format_duration(duration),
+    'total_size': total_size if total_size > 0 else None,
+    'predicted': _predict_transfer(resources, play['p_data'], opts),
+    'selected_qn': selected_qn_int,
+    'referer': referer,
+    'resources': resources
+  }
+
+
+async def iter_collection_items_async(videos, qn=None, cookie=None, select=None, max_workers=FANOUT_WORKERS, probe_sizes=False, rank_mirrors=False, policy=None, speculative=None):
+  videos = list(videos or [])
+  if select is not None:
+    videos = [videos[i - 1] for i in _parse_selection(select, len(videos))]
+  opts = _stream_opts(probe_sizes=probe_sizes, rank_mirrors=rank_mirrors, policy=policy, speculative=speculative)
+  async for idx, result, err in _iter_bounded(lambda v: _resolve_collection_video(v, qn, cookie, opts), videos, max_workers):
+    if err is not None:
+      video = videos[idx]
+      yield {
+        'ok': False,
+        'index': video.get('index'),
+        'bvid': video.get('bvid'),
+        'aid': video.get('aid'),
+        'title': video.get('title'),
+        'error': str(err)
+      }
+    else:
+      yield result
+
+
+async def _resolve_collection_batch(collection, qn, cookie, select=None, stream=False, opts=None):
+  items = iter_collection_items_async(collection.get('videos'), qn=qn, cookie=cookie, select=select, **(opts or {}))
+  if stream:
+    collection['_items'] = items
+    return collection
+  items = sorted([item async for item in items], key=lambda item: item.get('index') or 0)
+  total_size = sum(item.get('total_size') or 0 for item in items if item.get('ok'))
+  collection['items'] = items
+  collection['resolved_count'] = len([item for item in items if item.get('ok')])
+  collection['total_size'] = total_size if total_size > 0 else None
+  collection.setdefault('debug', {})['errors'] = list(collection.get('list_errors') or []) + [
+    {'index': item.get('index'), 'error': item.get('error')} for item in items if not item.get('ok')
+  ]
+  return collection
+
+
+async def parse_bilibili_async(url, qn=None, cookie=None, force_single=True, pages=None, batch=False, select=None, stream=False, probe_sizes=False, rank_mirrors=False, policy=None, speculative=None, timings=False):
+  opts = _stream_opts(probe_sizes=probe_sizes, rank_mirrors=rank_mirrors, policy=policy, speculative=speculative)
+  trace = _start_trace(timings)
+  token = _TRACE.set(trace)
+  try:
+    result = await _parse_bilibili(url, qn, cookie, force_single, pages, batch, select, stream, opts)
+  finally:
+    _TRACE.reset(token)
+  if trace is not None and timings:
+    result.setdefault('debug', {})['timings'] = trace.summary()
+  return result
+
 
+async def _parse_bilibili(url, qn, cookie, force_single, pages, batch, select, stream, opts):
+  if batch:
+    force_single = False
 
-def parse_bilibili(url, qn=None, cookie=None, force_single=True):
-  final_url = _resolve_redirect(url)
+  with _phase('resolve'):
+    final_url = await _resolve_url(url)
   bvid, aid, epid, ssid, media_id = _extract_ids(final_url)
   
   is_bangumi = epid or ssid
   is_collection = media_id
   
   if is_collection and not force_single:
-    return _parse_media_collection(final_url, media_id, qn, cookie)
+    collection = await _parse_media_collection(final_url, media_id, qn, cookie)
+    if batch:
+      return await _resolve_collection_batch(collection, qn, cookie, select=select, stream=stream, opts=opts)
+    return collection
   
   if is_bangumi:
-    return _parse_bangumi(final_url, epid, ssid, qn, cookie)
+    if batch:
+      return await _parse_bangumi_season(final_url, epid, ssid, qn, cookie, select=select, stream=stream, opts=opts)
+    return await _parse_bangumi(final_url, epid, ssid, qn, cookie, opts)
   
   if not bvid and not aid:
     raise ValueError('unsupported url')
 
-  view = _get_view_info(bvid=bvid, aid=aid, cookie=cookie)
-  view_code = (view or {}).get('code')
-  view_message = (view or {}).get('message')
-  data = (view or {}).get('data') or {}
-  
-  if view_code is not None and str(view_code) != '0':
-    raise ValueError(str(view_message or view_code))
+  page_index = _page_index(final_url)
+  known_cid = None
+  play_task = None
+  if force_single and pages is None:
+    known_cid = _known_cid(bvid, aid, page_index)
+    play_task = _start_play(bvid, aid, known_cid, qn, cookie, opts)
+
+  try:
+    view = await _get_view_info(bvid=bvid, aid=aid, cookie=cookie)
+    view_code = (view or {}).get('code')
+    view_message = (view or {}).get('message')
+    data = (view or {}).get('data') or {}
   
-  ubs = data.get('ubs')
-  if ubs and not force_single:
-    try:
-      return _parse_video_collection(final_url, bvid, aid, qn, cookie)
-    except ValueError as e:
-      if 'video not in collection' in str(e):
-        pass
-      else:
-        raise
+    if view_code is not None and str(view_code) != '0':
+      raise ValueError(str(view_message or view_code))
   
-  ugc_season = data.get('ugc_season')
-  if ugc_season and not force_single:
-    try:
-      return _parse_ugc_season(final_url, bvid, aid, qn, cookie)
-    except ValueError as e:
-      if 'video not in ugc season' in str(e):
-        pass
-      else:
-        raise
+    ubs = data.get('ubs')
+    if ubs and not force_single:
+      try:
+        collection = await _parse_video_collection(final_url, bvid, aid, qn, cookie)
+        if batch:
+          return await _resolve_collection_batch(collection, qn, cookie, select=select, stream=stream, opts=opts)
+        return collection
+      except ValueError as e:
+        if 'video not in collection' in str(e):
+          pass
+        else:
+          raise
   
-  title = _sanitize_filename(data.get('title') or '')
-  pages = data.get('pages') or []
-  if not pages:
-    raise ValueError('no pages')
-  cid = pages[0].get('cid')
-  if not cid:
-    raise ValueError('missing cid')
-
-  support_formats = data.get('support_formats') or []
-  support_qualities = {}
-  for fmt in support_formats:
-    try:
-      qn_int = int(fmt.get('quality'))
-    except Exception:
-      continue
-    desc = fmt.get('new_description') or fmt.get('description') or None
-    if desc is not None:
-      desc = str(desc).strip() or None
-    support_qualities[qn_int] = desc
-
-  if not bvid:
-    bvid = data.get('bvid') or bvid
-  if not aid:
-    aid = data.get('aid') or aid
-
-  referer = _build_referer(bvid=bvid, aid=aid)
-  play = _get_playurl(bvid=bvid, aid=aid, cid=cid, qn=qn, cookie=cookie)
-  play_code = (play or {}).get('code')
-  play_message = (play or {}).get('message')
-  p_data = (play or {}).get('data') or {}
-  if play_code is not None and str(play_code) != '0':
-    raise ValueError(str(play_message or play_code))
+    ugc_season = data.get('ugc_season')
+    if ugc_season and not force_single:
+      try:
+        collection = await _parse_ugc_season(final_url, bvid, aid, qn, cookie)
+        if batch:
+          return await _resolve_collection_batch(collection, qn, cookie, select=select, stream=stream, opts=opts)
+        return collection
+      except ValueError as e:
+        if 'video not in ugc season' in str(e):
+          pass
+        else:
+          raise
+  
+    if pages is not None:
+      return await _parse_video_pages(final_url, bvid, aid, data, pages, qn, cookie, stream=stream, opts=opts)
+
+    title = _sanitize_filename(data.get('title') or '')
+    pages = data.get('pages') or []
+    if not pages:
+      raise ValueError('no pages')
+    cid = _page_cid(pages, page_index)
+    if not cid:
+      raise ValueError('missing cid')
+
+    support_formats = data.get('support_formats') or []
+    support_qualities = {}
+    for fmt in support_formats:
+      try:
+        qn_int = int(fmt.get('quality'))
+      except Exception:
+        continue
+      desc = fmt.get('new_description') or fmt.get('description') or None
+      if desc is not None:
+        desc = str(desc).strip() or None
+      support_qualities[qn_int] = desc
 
-  accept_quality = p_data.get('accept_quality') or []
-  accept_desc = p_data.get('accept_description') or []
-  
-  if not accept_quality and support_formats:
-    accept_quality = [fmt.get('quality') for fmt in support_formats if fmt.get('quality')]
-    accept_desc = [fmt.get('new_description') or fmt.get('description') for fmt in support_formats]
+    if not bvid:
+      bvid = data.get('bvid') or bvid
+    if not aid:
+      aid = data.get('aid') or aid
+
+    referer = _build_referer(bvid=bvid, aid=aid)
+    audio_only = _audio_only(opts)
+    play = await _await_play(play_task, known_cid, cid, support_formats)
+  finally:
+    _cancel_play(play_task)
+  if play is None:
+    play = await _fetch_ugc_play(bvid, aid, cid, qn, cookie, support_formats, audio_only, (opts or {}).get('speculative'))
+  play_code = play['play_code']
+  play_message = play['play_message']
+  p_data = play['p_data']
+  accept_quality = play['accept_quality']
+  accept_desc = play['accept_description']
   
   qualities = []
   seen_qn = set()
@@ -364,92 +2392,13 @@ def parse_bilibili(url, qn=None, cookie=None, force_single=True):
       support_qualities[qn_int] = desc
     qualities.append({'qn': qn_int, 'desc': desc})
 
-  if not qualities and support_qualities:
+  if not qualities and support_qualities and not audio_only:
     for qn_int, desc in support_qualities.items():
       qualities.append({'qn': qn_int, 'desc': desc})
 
   qualities.sort(key=lambda item: item.get('qn') or 0, reverse=True)
 
-  durl = p_data.get('durl') or []
-  dash = p_data.get('dash')
-  
-  if (not durl) and (not dash) and accept_quality and (qn is None or (not str(qn).strip()) or str(qn).strip() == '0'):
-    play = _get_playurl(bvid=bvid, aid=aid, cid=cid, qn=accept_quality[0], cookie=cookie)
-    p_data = (play or {}).get('data') or {}
-    durl = p_data.get('durl') or []
-    dash = p_data.get('dash')
-
-  available_dash_ids = []
-  if isinstance(dash, dict):
-    video_list = dash.get('video') or []
-    for v in video_list:
-      try:
-        vid = int(v.get('id', 0))
-      except Exception:
-        continue
-      if vid > 0:
-        available_dash_ids.append(vid)
-    if available_dash_ids:
-      available_dash_ids = sorted(set(available_dash_ids), reverse=True)
-
-  requested_qn_int = None
-  if qn is not None and str(qn).strip():
-    try:
-      requested_qn_int = int(str(qn).strip())
-    except Exception:
-      requested_qn_int = None
-
-  selected_qn_int = None
-  if available_dash_ids:
-    if requested_qn_int is not None:
-      if requested_qn_int in available_dash_ids:
-        selected_qn_int = requested_qn_int
-      else:
-        higher = [x for x in available_dash_ids if x >= requested_qn_int]
-        if higher:
-          selected_qn_int = higher[0]
-        else:
-          lower = [x for x in available_dash_ids if x <= requested_qn_int]
-          if lower:
-            selected_qn_int = lower[0]
-          else:
-            selected_qn_int = available_dash_ids[0]
-    else:
-      selected_qn_int = available_dash_ids[0]
-
-  resources = []
-  total_size = 0
-
-  if dash:
-    effective_qn_for_dash = selected_qn_int if selected_qn_int is not None else requested_qn_int
-    resources, total_size = _extract_dash_resources(dash, effective_qn_for_dash, title, referer)
-  elif durl:
-    for idx, item in enumerate(durl):
-      u = item.get('url')
-      if not u:
-        continue
-      path = urllib.parse.urlparse(u).path or ''
-      ext = ''
-      m_ext = re.search(r'\.([A-Za-z0-9]{1,6})$', path)
-      if m_ext:
-        ext = '.' + m_ext.group(1)
-      else:
-        ext = '.mp4'
-      name = title + ext if len(durl) == 1 else f'{title}.part{idx + 1}{ext}'
-      size = item.get('size')
-      try:
-        size_int = int(size) if size is not None else 0
-      except Exception:
-        size_int = 0
-      if size_int > 0:
-        total_size += size_int
-      resources.append({
-        'url': u,
-        'name': name,
-        'referer': referer,
-        'user_agent': CHROME_UA,
-        'size': size_int
-      })
+  resources, total_size, available_dash_ids, requested_qn_int, selected_qn_int = await _build_resources(p_data, qn, title, referer, opts)
   
   if not resources:
     raise ValueError('no playurl')
@@ -474,6 +2423,7 @@ def parse_bilibili(url, qn=None, cookie=None, force_single=True):
     'duration': duration,
     'duration_text': _format_duration(duration),
     'total_size': total_size if total_size > 0 else None,
+    'predicted': _predict_transfer(resources, p_data, opts),
     'qualities': qualities,
     'bvid': bvid,
     'aid': aid,
@@ -497,8 +2447,67 @@ def parse_bilibili(url, qn=None, cookie=None, force_single=True):
   }
 
 
-def _parse_bangumi(final_url, epid, ssid, qn, cookie):
-  bangumi = _get_bangumi_info(epid=epid, ssid=ssid, cookie=cookie)
+async def iter_parse_bilibili_async(url, qn=None, cookie=None, force_single=True, pages=None, batch=False, select=None, probe_sizes=False, rank_mirrors=False, policy=None, speculative=None, timings=False):
+  started = time.time()
+  opts = _stream_opts(probe_sizes=probe_sizes, rank_mirrors=rank_mirrors, policy=policy, speculative=speculative)
+  # each step of the generator may run in a fresh task, so the trace is re-bound after every yield
+  trace = _start_trace(timings)
+  _TRACE.set(trace)
+  result = await _parse_bilibili(url, qn, cookie, force_single, pages, batch, select, True, opts)
+  items = result.pop('_items', None)
+  header = dict(result)
+  header['record'] = 'header'
+  yield header
+  _TRACE.set(trace)
+
+  total = 0
+  resolved = 0
+  total_size = 0
+  # listing pages that failed are reported next to the items that did
+  errors = list(result.get('list_errors') or [])
+  if items is not None:
+    async for item in items:
+      total += 1
+      if item.get('ok'):
+        resolved += 1
+        total_size += item.get('total_size') or 0
+      else:
+        errors.append({'index': item.get('index'), 'page': item.get('page'), 'error': item.get('error')})
+      record = dict(item)
+      record['record'] = 'item'
+      yield record
+      _TRACE.set(trace)
+
+  _TRACE.set(None)
+  trailer = {
+    'record': 'trailer',
+    'ok': True,
+    'total': total,
+    'resolved': resolved,
+    'failed': len(errors),
+    'total_size': total_size if total_size > 0 else None,
+    'errors': errors,
+    'elapsed': round(time.time() - started, 3)
+  }
+  if trace is not None and timings:
+    trailer['timings'] = trace.summary()
+  yield trailer
+
+
+def parse_bilibili(url, qn=None, cookie=None, force_single=True, pages=None, batch=False, select=None, probe_sizes=False, rank_mirrors=False, policy=None, speculative=None, timings=False):
+  return _ENGINE.run(parse_bilibili_async(url, qn=qn, cookie=cookie, force_single=force_single, pages=pages, batch=batch, select=select, probe_sizes=probe_sizes, rank_mirrors=rank_mirrors, policy=policy, speculative=speculative, timings=timings))
+
+
+def iter_parse_bilibili(url, qn=None, cookie=None, force_single=True, pages=None, batch=False, select=None, probe_sizes=False, rank_mirrors=False, policy=None, speculative=None, timings=False):
+  return _ENGINE.iterate(iter_parse_bilibili_async(url, qn=qn, cookie=cookie, force_single=force_single, pages=pages, batch=batch, select=select, probe_sizes=probe_sizes, rank_mirrors=rank_mirrors, policy=policy, speculative=speculative, timings=timings))
+
+
+def iter_collection_items(videos, qn=None, cookie=None, select=None, max_workers=FANOUT_WORKERS, probe_sizes=False, rank_mirrors=False, policy=None, speculative=None):
+  return _ENGINE.iterate(iter_collection_items_async(videos, qn=qn, cookie=cookie, select=select, max_workers=max_workers, probe_sizes=probe_sizes, rank_mirrors=rank_mirrors, policy=policy, speculative=speculative))
+
+
+async def _parse_bangumi(final_url, epid, ssid, qn, cookie, opts=None):
+  bangumi = await _get_bangumi_info(epid=epid, ssid=ssid, cookie=cookie)
   bangumi_code = (bangumi or {}).get('code')
   bangumi_message = (bangumi or {}).get('message')
   b_data = (bangumi or {}).get('data') or {}
@@ -532,16 +2541,13 @@ def _parse_bangumi(final_url, epid, ssid, qn, cookie):
   
   referer = f'https://www.bilibili.com/bangumi/play/ep{epid_final}/'
   
-  play = _get_bangumi_playurl(epid_final, cid, qn=qn, cookie=cookie)
-  play_code = (play or {}).get('code')
-  play_message = (play or {}).get('message')
-  p_data = (play or {}).get('data') or {}
-  
-  if play_code is not None and str(play_code) != '0':
-    raise ValueError(str(play_message or play_code))
-  
-  accept_quality = p_data.get('accept_quality') or []
-  accept_desc = p_data.get('accept_description') or []
+  audio_only = _audio_only(opts)
+  play = await _fetch_pgc_play(epid_final, cid, qn, cookie, audio_only, (opts or {}).get('speculative'))
+  play_code = play['play_code']
+  play_message = play['play_message']
+  p_data = play['p_data']
+  accept_quality = play['accept_quality']
+  accept_desc = play['accept_description']
   
   qualities = []
   for idx, q in enumerate(accept_quality):
@@ -556,88 +2562,9 @@ def _parse_bangumi(final_url, epid, ssid, qn, cookie):
   
   qualities.sort(key=lambda item: item.get('qn') or 0, reverse=True)
   
-  durl = p_data.get('durl') or []
-  dash = p_data.get('dash')
-  
-  if (not durl) and (not dash) and accept_quality and (qn is None or (not str(qn).strip()) or str(qn).strip() == '0'):
-    play = _get_bangumi_playurl(epid_final, cid, qn=accept_quality[0], cookie=cookie)
-    p_data = (play or {}).get('data') or {}
-    durl = p_data.get('durl') or []
-    dash = p_data.get('dash')
-  
-  available_dash_ids = []
-  if isinstance(dash, dict):
-    video_list = dash.get('video') or []
-    for v in video_list:
-      try:
-        vid = int(v.get('id', 0))
-      except Exception:
-        continue
-      if vid > 0:
-        available_dash_ids.append(vid)
-    if available_dash_ids:
-      available_dash_ids = sorted(set(available_dash_ids), reverse=True)
-  
-  requested_qn_int = None
-  if qn is not None and str(qn).strip():
-    try:
-      requested_qn_int = int(str(qn).strip())
-    except Exception:
-      requested_qn_int = None
-  
-  selected_qn_int = None
-  if available_dash_ids:
-    if requested_qn_int is not None:
-      if requested_qn_int in available_dash_ids:
-        selected_qn_int = requested_qn_int
-      else:
-        higher = [x for x in available_dash_ids if x >= requested_qn_int]
-        if higher:
-          selected_qn_int = higher[0]
-        else:
-          lower = [x for x in available_dash_ids if x <= requested_qn_int]
-          if lower:
-            selected_qn_int = lower[0]
-          else:
-            selected_qn_int = available_dash_ids[0]
-    else:
-      selected_qn_int = available_dash_ids[0]
-  
-  resources = []
-  total_size = 0
-  
   title = f"{season_title}_{episode_title}" if season_title and episode_title else (season_title or episode_title or 'bangumi')
   
-  if dash:
-    effective_qn_for_dash = selected_qn_int if selected_qn_int is not None else requested_qn_int
-    resources, total_size = _extract_dash_resources(dash, effective_qn_for_dash, title, referer)
-  elif durl:
-    for idx, item in enumerate(durl):
-      u = item.get('url')
-      if not u:
-        continue
-      path = urllib.parse.urlparse(u).path or ''
-      ext = ''
-      m_ext = re.search(r'\.([A-Za-z0-9]{1,6})$', path)
-      if m_ext:
-        ext = '.' + m_ext.group(1)
-      else:
-        ext = '.mp4'
-      name = title + ext if len(durl) == 1 else f'{title}.part{idx + 1}{ext}'
-      size = item.get('size')
-      try:
-        size_int = int(size) if size is not None else 0
-      except Exception:
-        size_int = 0
-      if size_int > 0:
-        total_size += size_int
-      resources.append({
-        'url': u,
-        'name': name,
-        'referer': referer,
-        'user_agent': CHROME_UA,
-        'size': size_int
-      })
+  resources, total_size, available_dash_ids, requested_qn_int, selected_qn_int = await _build_resources(p_data, qn, title, referer, opts)
   
   if not resources:
     raise ValueError('no playurl')
@@ -657,6 +2584,7 @@ def _parse_bangumi(final_url, epid, ssid, qn, cookie):
     'duration': duration,
     'duration_text': _format_duration(duration),
     'total_size': total_size if total_size > 0 else None,
+    'predicted': _predict_transfer(resources, p_data, opts),
     'qualities': qualities,
     'bvid': bvid,
     'aid': aid,
@@ -683,8 +2611,145 @@ def _parse_bangumi(final_url, epid, ssid, qn, cookie):
   }
 
 
-def _get_video_quality_info(bvid=None, aid=None, cookie=None):
-  view = _get_view_info(bvid=bvid, aid=aid, cookie=cookie)
+def _audio_play(play):
+  play_code = (play or {}).get('code')
+  play_message = (play or {}).get('message')
+  if play_code is not None and str(play_code) != '0':
+    raise ValueError(str(play_message or play_code))
+  return {
+    'play_code': play_code,
+    'play_message': play_message,
+    'p_data': (play or {}).get('data') or (play or {}).get('result') or {},
+    'accept_quality': [],
+    'accept_description': []
+  }
+
+
+async def _fetch_pgc_play(epid, cid, qn, cookie, audio_only=False, speculative=None):
+  if audio_only:
+    return _audio_play(await _get_bangumi_playurl(epid, cid, cookie=cookie, fnval=AUDIO_FNVAL))
+
+  async def fetch(q):
+    return await _get_bangumi_playurl(epid, cid, qn=q, cookie=cookie)
+
+  return await _fetch_play('pgc', fetch, qn, SPECULATIVE_TOP_QN, speculative)
+
+
+async def _resolve_bangumi_episode(season_title, episode, qn, cookie, opts=None):
+  cid = episode.get('cid')
+  epid = episode.get('id')
+  if not cid:
+    raise ValueError('missing cid')
+  episode_title = _sanitize_filename(episode.get('title') or episode.get('long_title') or '')
+  title = f"{season_title}_{episode_title}" if season_title and episode_title else (season_title or episode_title or 'bangumi')
+  referer = f'https://www.bilibili.com/bangumi/play/ep{epid}/'
+  play = await _fetch_pgc_play(epid, cid, qn, cookie, _audio_only(opts), (opts or {}).get('speculative'))
+  resources, total_size, _, _, selected_qn_int = await _build_resources(play['p_data'], qn, title, referer, opts)
+  if not resources:
+    raise ValueError('no playurl')
+  duration = episode.get('duration')
+  return {
+    'ok': True,
+    'epid': epid,
+    'cid': cid,
+    'bvid': episode.get('bvid'),
+    'aid': episode.get('aid'),
+    'title': title,
+    'episode_title': episode_title,
+    'duration': duration,
+    'duration_text': _format_duration(duration),
+    'total_size': total_size if total_size > 0 else None,
+    'predicted': _predict_transfer(resources, play['p_data'], opts),
+    'selected_qn': selected_qn_int,
+    'referer': referer,
+    'resources': resources
+  }
+
+
+async def _iter_bangumi_episodes(season_title, targets, qn, cookie, opts=None):
+  async for idx, result, err in _iter_bounded(lambda item: _resolve_bangumi_episode(season_title, item[1], qn, cookie, opts), targets):
+    index, episode = targets[idx]
+    if err is not None:
+      yield {'ok': False, 'index': index, 'epid': episode.get('id'), 'cid': episode.get('cid'), 'error': str(err)}
+    else:
+      result['index'] = index
+      yield result
+
+
+async def _parse_bangumi_season(final_url, epid, ssid, qn, cookie, select=None, stream=False, opts=None):
+  bangumi = await _get_bangumi_info(epid=epid, ssid=ssid, cookie=cookie)
+  bangumi_code = (bangumi or {}).get('code')
+  bangumi_message = (bangumi or {}).get('message')
+  b_data = (bangumi or {}).get('data') or {}
+
+  if bangumi_code is not None and str(bangumi_code) != '0':
+    raise ValueError(str(bangumi_message or bangumi_code))
+
+  season_title = _sanitize_filename(b_data.get('title') or '')
+  episodes = b_data.get('episodes') or []
+  if not episodes:
+    raise ValueError('no episodes')
+
+  original_episode_index = None
+  listing = []
+  for idx, ep in enumerate(episodes):
+    if epid and str(ep.get('id')) == str(epid):
+      original_episode_index = idx + 1
+    duration = ep.get('duration')
+    listing.append({
+      'index': idx + 1,
+      'epid': ep.get('id'),
+      'cid': ep.get('cid'),
+      'bvid': ep.get('bvid'),
+      'aid': ep.get('aid'),
+      'title': _sanitize_filename(ep.get('title') or ep.get('long_title') or f'episode_{idx + 1}'),
+      'duration': duration,
+      'duration_text': _format_duration(duration)
+    })
+
+  selected = _parse_selection(select, len(episodes))
+  targets = [(i, episodes[i - 1]) for i in selected]
+
+  owner_name = None
+  publisher = b_data.get('publisher') or {}
+  if isinstance(publisher, dict) and publisher.get('name'):
+    owner_name = str(publisher.get('name'))
+
+  result = {
+    'ok': True,
+    'type': 'season',
+    'title': season_title,
+    'owner': owner_name,
+    'season_id': b_data.get('season_id') or ssid,
+    'total_episodes': len(episodes),
+    'episodes': listing,
+    'original_episode_index': original_episode_index,
+    'final_url': final_url,
+    'debug': {
+      'requested_qn': _parse_qn(qn),
+      'selected_episodes': selected,
+      'has_cookie': True if cookie else False,
+      'has_sessdata': True if (cookie and ('SESSDATA=' in cookie)) else False,
+      'bangumi_code': bangumi_code,
+      'bangumi_message': bangumi_message
+    }
+  }
+  items = _iter_bangumi_episodes(season_title, targets, qn, cookie, opts)
+  if stream:
+    result['_items'] = items
+    return result
+
+  items = sorted([item async for item in items], key=lambda item: item.get('index') or 0)
+  total_size = sum(item.get('total_size') or 0 for item in items if item.get('ok'))
+  result['items'] = items
+  result['resolved_count'] = len([item for item in items if item.get('ok')])
+  result['total_size'] = total_size if total_size > 0 else None
+  result['debug']['errors'] = [{'index': item.get('index'), 'error': item.get('error')} for item in items if not item.get('ok')]
+  return result
+
+
+async def _get_video_quality_info(bvid=None, aid=None, cookie=None):
+  view = await _get_view_info(bvid=bvid, aid=aid, cookie=cookie)
   view_code = (view or {}).get('code')
   view_message = (view or {}).get('message')
   data = (view or {}).get('data') or {}
@@ -716,7 +2781,7 @@ def _get_video_quality_info(bvid=None, aid=None, cookie=None):
   if not aid:
     aid = data.get('aid') or aid
 
-  play = _get_playurl(bvid=bvid, aid=aid, cid=cid, qn=None, cookie=cookie)
+  play = await _get_playurl(bvid=bvid, aid=aid, cid=cid, qn=None, cookie=cookie)
   play_code = (play or {}).get('code')
   play_message = (play or {}).get('message')
   p_data = (play or {}).get('data') or {}
@@ -758,8 +2823,8 @@ def _get_video_quality_info(bvid=None, aid=None, cookie=None):
   return {'qualities': qualities}
 
 
-def _parse_video_collection(final_url, bvid, aid, qn, cookie):
-  view = _get_view_info(bvid=bvid, aid=aid, cookie=cookie)
+async def _parse_video_collection(final_url, bvid, aid, qn, cookie):
+  view = await _get_view_info(bvid=bvid, aid=aid, cookie=cookie)
   view_code = (view or {}).get('code')
   view_message = (view or {}).get('message')
   data = (view or {}).get('data') or {}
@@ -788,7 +2853,7 @@ def _parse_video_collection(final_url, bvid, aid, qn, cookie):
   if not media_id:
     raise ValueError('video not in collection')
   
-  collection = _get_media_collection_info(media_id, cookie=cookie)
+  collection = await _get_media_collection_info(media_id, cookie=cookie)
   collection_code = (collection or {}).get('code')
   collection_message = (collection or {}).get('message')
   c_data = (collection or {}).get('data') or {}
@@ -805,7 +2870,8 @@ def _parse_video_collection(final_url, bvid, aid, qn, cookie):
     if v:
       collection_owner_name = str(v)
   
-  media_list = c_data.get('media_list') or []
+  list_errors = []
+  media_list = [item async for item in _iter_media_collection_items(media_id, c_data, cookie, list_errors)]
   
   if not media_list:
     raise ValueError('no media in collection')
@@ -832,6 +2898,7 @@ def _parse_video_collection(final_url, bvid, aid, qn, cookie):
     videos.append({
       'bvid': vid_bvid,
       'aid': vid_aid,
+      'cid': (media.get('ugc') or {}).get('first_cid'),
       'title': vid_title,
       'duration': duration,
       'duration_text': _format_duration(duration),
@@ -845,7 +2912,7 @@ def _parse_video_collection(final_url, bvid, aid, qn, cookie):
   qualities = []
   if original_video_bvid_for_quality or original_video_aid_for_quality:
     try:
-      quality_info = _get_video_quality_info(bvid=original_video_bvid_for_quality, aid=original_video_aid_for_quality, cookie=cookie)
+      quality_info = await _get_video_quality_info(bvid=original_video_bvid_for_quality, aid=original_video_aid_for_quality, cookie=cookie)
       qualities = quality_info.get('qualities', [])
     except Exception:
       pass
@@ -859,6 +2926,7 @@ def _parse_video_collection(final_url, bvid, aid, qn, cookie):
     'media_id': media_id,
     'total_videos': len(videos),
     'videos': videos,
+    'list_errors': list_errors,
     'original_video_index': original_video_index,
     'qualities': qualities,
     'final_url': final_url,
@@ -874,8 +2942,8 @@ def _parse_video_collection(final_url, bvid, aid, qn, cookie):
   }
 
 
-def _parse_ugc_season(final_url, bvid, aid, qn, cookie):
-  view = _get_view_info(bvid=bvid, aid=aid, cookie=cookie)
+async def _parse_ugc_season(final_url, bvid, aid, qn, cookie):
+  view = await _get_view_info(bvid=bvid, aid=aid, cookie=cookie)
   view_code = (view or {}).get('code')
   view_message = (view or {}).get('message')
   data = (view or {}).get('data') or {}
@@ -907,7 +2975,7 @@ def _parse_ugc_season(final_url, bvid, aid, qn, cookie):
   season_title = _sanitize_filename(ugc_season.get('title') or '')
   season_desc = ugc_season.get('intro') or ''
   
-  season_info = _get_ugc_season_info(season_id, cookie=cookie)
+  season_info = await _get_ugc_season_info(season_id, cookie=cookie)
   season_code = (season_info or {}).get('code')
   season_message = (season_info or {}).get('message')
   s_data = (season_info or {}).get('data') or {}
@@ -915,7 +2983,8 @@ def _parse_ugc_season(final_url, bvid, aid, qn, cookie):
   if season_code is not None and str(season_code) != '0':
     raise ValueError(str(season_message or season_code))
   
-  archives = s_data.get('archives') or []
+  list_errors = []
+  archives = [item async for item in _iter_ugc_season_archives(season_id, s_data, cookie, list_errors)]
   
   if not archives:
     raise ValueError('no videos in season')
@@ -953,7 +3022,7 @@ def _parse_ugc_season(final_url, bvid, aid, qn, cookie):
   qualities = []
   if original_video_bvid_for_quality or original_video_aid_for_quality:
     try:
-      quality_info = _get_video_quality_info(bvid=original_video_bvid_for_quality, aid=original_video_aid_for_quality, cookie=cookie)
+      quality_info = await _get_video_quality_info(bvid=original_video_bvid_for_quality, aid=original_video_aid_for_quality, cookie=cookie)
       qualities = quality_info.get('qualities', [])
     except Exception:
       pass
@@ -967,6 +3036,7 @@ def _parse_ugc_season(final_url, bvid, aid, qn, cookie):
     'season_id': season_id,
     'total_videos': len(videos),
     'videos': videos,
+    'list_errors': list_errors,
     'original_video_index': original_video_index,
     'qualities': qualities,
     'final_url': final_url,
@@ -982,8 +3052,8 @@ def _parse_ugc_season(final_url, bvid, aid, qn, cookie):
   }
 
 
-def _parse_media_collection(final_url, media_id, qn, cookie):
-  collection = _get_media_collection_info(media_id, cookie=cookie)
+async def _parse_media_collection(final_url, media_id, qn, cookie):
+  collection = await _get_media_collection_info(media_id, cookie=cookie)
   collection_code = (collection or {}).get('code')
   collection_message = (collection or {}).get('message')
   c_data = (collection or {}).get('data') or {}
@@ -1000,7 +3070,8 @@ def _parse_media_collection(final_url, media_id, qn, cookie):
     if v:
       owner_name = str(v)
   
-  media_list = c_data.get('media_list') or []
+  list_errors = []
+  media_list = [item async for item in _iter_media_collection_items(media_id, c_data, cookie, list_errors)]
   
   if not media_list:
     raise ValueError('no media in collection')
@@ -1019,6 +3090,7 @@ def _parse_media_collection(final_url, media_id, qn, cookie):
     videos.append({
       'bvid': bvid,
       'aid': aid,
+      'cid': (media.get('ugc') or {}).get('first_cid'),
       'title': title,
       'duration': duration,
       'duration_text': _format_duration(duration),
@@ -1038,6 +3110,7 @@ def _parse_media_collection(final_url, media_id, qn, cookie):
     'media_id': media_id,
     'total_videos': len(videos),
     'videos': videos,
+    'list_errors': list_errors,
     'final_url': final_url,
     'debug': {
       'has_cookie': True if cookie else False,
@@ -1056,9 +3129,78 @@ def main(argv):
   qn = None
   cookie = os.environ.get('BILI_COOKIE') or None
   force_single = True
+  pages = None
+  batch = False
+  select = None
+  stream = False
+  probe_sizes = False
+  rank_mirrors = False
+  policy = {}
+  speculative = None
+  timings = False
   i = 2
   while i < len(argv):
     a = argv[i]
+    if a == '--pages' and i + 1 < len(argv):
+      pages = argv[i + 1]
+      i += 2
+      continue
+    if a == '--batch':
+      batch = True
+      i += 1
+      continue
+    if a == '--stream':
+      stream = True
+      i += 1
+      continue
+    if a == '--probe-sizes':
+      probe_sizes = True
+      i += 1
+      continue
+    if a == '--rank-mirrors':
+      rank_mirrors = True
+      i += 1
+      continue
+    if a == '--speculative':
+      speculative = True
+      i += 1
+      continue
+    if a == '--timings':
+      timings = True
+      i += 1
+      continue
+    if a == '--no-speculative':
+      speculative = False
+      i += 1
+      continue
+    if a == '--codecs' and i + 1 < len(argv):
+      policy['codecs'] = argv[i + 1]
+      i += 2
+      continue
+    if a == '--prefer' and i + 1 < len(argv):
+      policy['prefer'] = argv[i + 1]
+      i += 2
+      continue
+    if a == '--max-bitrate' and i + 1 < len(argv):
+      policy['max_bitrate'] = argv[i + 1]
+      i += 2
+      continue
+    if a == '--audio-only':
+      policy['audio_only'] = True
+      i += 1
+      continue
+    if a == '--throughput' and i + 1 < len(argv):
+      policy['throughput'] = argv[i + 1]
+      i += 2
+      continue
+    if a == '--budget' and i + 1 < len(argv):
+      policy['budget_seconds'] = argv[i + 1]
+      i += 2
+      continue
+    if a == '--select' and i + 1 < len(argv):
+      select = argv[i + 1]
+      i += 2
+      continue
     if a == '--qn' and i + 1 < len(argv):
       qn = argv[i + 1]
       i += 2
@@ -1072,9 +3214,27 @@ def main(argv):
       i += 1
       continue
     i += 1
-  result = parse_bilibili(url, qn=qn, cookie=cookie, force_single=force_single)
-  data = json.dumps(result, ensure_ascii=False)
   out = getattr(sys.stdout, 'buffer', None)
+  if stream:
+    try:
+      for record in iter_parse_bilibili(url, qn=qn, cookie=cookie, force_single=force_single, pages=pages, batch=batch, select=select, probe_sizes=probe_sizes, rank_mirrors=rank_mirrors, policy=policy, speculative=speculative, timings=timings):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        if out is not None:
+          out.write(line.encode('utf-8', errors='replace'))
+          out.flush()
+        else:
+          sys.stdout.write(line)
+          sys.stdout.flush()
+    except Exception as e:
+      line = json.dumps({'record': 'error', 'ok': False, 'error': str(e)}, ensure_ascii=False) + '\n'
+      if out is not None:
+        out.write(line.encode('utf-8', errors='replace'))
+      else:
+        sys.stdout.write(line)
+      return 1
+    return 0
+  result = parse_bilibili(url, qn=qn, cookie=cookie, force_single=force_single, pages=pages, batch=batch, select=select, probe_sizes=probe_sizes, rank_mirrors=rank_mirrors, policy=policy, speculative=speculative, timings=timings)
+  data = json.dumps(result, ensure_ascii=False)
   if out is not None:
     out.write(data.encode('utf-8', errors='replace'))
   else:
@@ -0,0 +1,403 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, os.path.join(ROOT, 'parsers'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+sys.path.insert(0, ROOT)
+
+import bilibili_parser as bp  # noqa: E402
+import fake_api  # noqa: E402
+import main  # noqa: E402
+
+SINGLE_URL = 'https://www.bilibili.com/video/BV1Bench0001'
+SEASON_URL = 'https://www.bilibili.com/video/BV1BenchCol5'
+FAVLIST_URL = 'https://www.bilibili.com/medialist/detail/media/md9001'
+
+
+class FakeAPITestCase(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.api = fake_api.FakeBilibiliAPI()
+    cls.api.start()
+    cls.api_base = bp.API_BASE
+    bp.API_BASE = cls.api.base
+
+  @classmethod
+  def tearDownClass(cls):
+    bp.API_BASE = cls.api_base
+    cls.api.stop()
+
+  def setUp(self):
+    for cache in (bp._METADATA_CACHE, bp._PLAYURL_CACHE, bp._MIRROR_SCORES, bp._PAGE_MAPS):
+      cache.clear()
+
+
+class ExtractIdsTest(unittest.TestCase):
+  def test_aid_is_not_read_from_inside_a_bvid(self):
+    # "Av4" inside the BV id used to be returned as aid '4'
+    self.assertEqual(bp._extract_ids('https://www.bilibili.com/video/BV1Av4y1x7Ab'), ('BV1Av4y1x7Ab', None, None, None, None))
+
+  def test_av_url(self):
+    self.assertEqual(bp._extract_ids('https://www.bilibili.com/video/av170001?p=2'), (None, '170001', None, None, None))
+
+  def test_bangumi_and_media_urls(self):
+    self.assertEqual(bp._extract_ids('https://www.bilibili.com/bangumi/play/ep12345'), (None, None, '12345', None, None))
+    self.assertEqual(bp._extract_ids('https://www.bilibili.com/bangumi/play/ss4242'), (None, None, None, '4242', None))
+    self.assertEqual(bp._extract_ids('https://www.bilibili.com/medialist/detail/media/md9001'), (None, None, None, None, '9001'))
+
+
+class TTLCacheTest(unittest.TestCase):
+  def test_entries_expire(self):
+    cache = bp._TTLCache(4)
+    cache.set('a', 1, 0.05)
+    cache.set('b', 2, 60)
+    cache.set('c', 3, 0)
+    self.assertEqual(cache.get('a'), 1)
+    time.sleep(0.06)
+    self.assertIsNone(cache.get('a'))
+    self.assertEqual(cache.get('b'), 2)
+    self.assertIsNone(cache.get('c'))
+
+  def test_least_recently_used_is_evicted(self):
+    cache = bp._TTLCache(2)
+    cache.set('a', 1, 60)
+    cache.set('b', 2, 60)
+    cache.get('a')
+    cache.set('c', 3, 60)
+    self.assertEqual(cache.get('a'), 1)
+    self.assertIsNone(cache.get('b'))
+    self.assertEqual(cache.get('c'), 3)
+
+
+class DiskCacheTest(unittest.TestCase):
+  def setUp(self):
+    self.path = os.path.join(tempfile.mkdtemp(), 'cache.db')
+
+  def test_entries_persist_across_instances_until_they_expire(self):
+    bp._DiskCache(self.path).set('view:BV1', {'title': 'kept'}, 60)
+    bp._DiskCache(self.path).set('view:BV2', {'title': 'expired'}, 0.05)
+    time.sleep(0.06)
+    cache = bp._DiskCache(self.path)
+    value, ttl = cache.get('view:BV1')
+    self.assertEqual(value, {'title': 'kept'})
+    self.assertTrue(0 < ttl <= 60)
+    self.assertEqual(cache.get('view:BV2'), (None, 0))
+
+  def test_writes_past_the_limit_evict_the_oldest_entries(self):
+    cache = bp._DiskCache(self.path, max_entries=10)
+    for n in range(bp.DISK_CACHE_EVICT_EVERY + 1):
+      cache.set(f'k{n}', n, 60)
+    count = cache._connect().execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+    self.assertLessEqual(count, 10)
+    self.assertEqual(cache.get(f'k{bp.DISK_CACHE_EVICT_EVERY}')[0], bp.DISK_CACHE_EVICT_EVERY)
+    self.assertEqual(cache.get('k0'), (None, 0))
+
+  def test_updates_from_separate_instances_accumulate(self):
+    first = bp._DiskCache(self.path)
+    second = bp._DiskCache(self.path)
+    for cache in (first, second, first):
+      cache._update('fallbacks', lambda counts: bp._add_fallback(counts, True), 60)
+    self.assertEqual(bp._DiskCache(self.path).get('fallbacks')[0], [3, 3])
+
+  def test_async_access_goes_through_the_executor(self):
+    cache = bp._DiskCache(self.path)
+
+    async def run():
+      cache.set_later('url:https://b23.tv/x', 'https://www.bilibili.com/video/BV1Bench0001', 60)
+
+    asyncio.run(run())
+    self.assertEqual(asyncio.run(cache.get_async('url:https://b23.tv/x'))[0], 'https://www.bilibili.com/video/BV1Bench0001')
+
+  def test_without_a_path_the_cache_is_disabled(self):
+    cache = bp._DiskCache(None)
+    cache.set('k', 1, 60)
+    self.assertEqual(cache.get('k'), (None, 0))
+
+
+class ShortLinkCacheTest(unittest.TestCase):
+  def test_least_recently_used_link_is_dropped_from_the_file(self):
+    path = os.path.join(tempfile.mkdtemp(), 'short_links.json')
+    cache = bp._LRUCache(2, path=path)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    self.assertFalse(os.path.exists(path))
+    cache.flush()
+    reloaded = bp._LRUCache(2, path=path)
+    self.assertEqual((reloaded.get('a'), reloaded.get('b'), reloaded.get('c')), (1, None, 3))
+
+  def test_sets_on_the_loop_are_written_off_the_loop(self):
+    path = os.path.join(tempfile.mkdtemp(), 'short_links.json')
+    cache = bp._LRUCache(2, path=path)
+    writers = []
+    save = cache._save
+
+    def recording_save(items):
+      writers.append(threading.get_ident())
+      save(items)
+
+    cache._save = recording_save
+
+    async def run():
+      for n in range(3):
+        cache.set_later(f'https://b23.tv/{n}', f'https://www.bilibili.com/video/BV1Short000{n}')
+      return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    self.assertTrue(writers)
+    self.assertNotIn(loop_thread, writers)
+    reloaded = bp._LRUCache(2, path=path)
+    self.assertIsNone(reloaded.get('https://b23.tv/0'))
+    self.assertEqual(reloaded.get('https://b23.tv/2'), 'https://www.bilibili.com/video/BV1Short0002')
+
+
+class EntryPointTest(FakeAPITestCase):
+  def test_async_and_blocking_calls_share_the_pool(self):
+    # pooled connections must not leak between the engine loop and asyncio.run() loops
+    first = asyncio.run(bp.parse_bilibili_async(SINGLE_URL))
+    self.setUp()
+    second = bp.parse_bilibili(SINGLE_URL)
+    self.setUp()
+    third = asyncio.run(bp.parse_bilibili_async(SINGLE_URL))
+    for result in (first, second, third):
+      self.assertTrue(result['ok'])
+      self.assertEqual(result['bvid'], 'BV1Bench0001')
+
+
+class RecordReplayTest(FakeAPITestCase):
+  def test_recording_replays_without_the_api(self):
+    path = os.path.join(tempfile.mkdtemp(), 'single.jsonl.gz')
+    recorder = bp._RecordingTransport(bp._PoolTransport(bp._POOL), path)
+    previous = bp.set_http_transport(recorder)
+    try:
+      recorded = bp.parse_bilibili(SINGLE_URL, probe_sizes=True)
+      recorder.close()
+      self.setUp()
+      replay = bp._ReplayTransport(path)
+      bp.set_http_transport(replay)
+      self.api.reset_counts()
+      replayed = bp.parse_bilibili(SINGLE_URL, probe_sizes=True)
+    finally:
+      bp.set_http_transport(previous)
+    self.assertEqual(self.api.snapshot_counts(), {})
+    self.assertEqual(replay.misses, 0)
+    self.assertEqual(replay.requests, recorder.requests)
+    self.assertEqual(replayed['total_size'], recorded['total_size'])
+    self.assertEqual([r['size'] for r in replayed['resources']], [r['size'] for r in recorded['resources']])
+
+
+class SelectionPolicyTest(FakeAPITestCase):
+  def streams(self, **policy):
+    result = bp.parse_bilibili(SINGLE_URL, policy=policy)
+    self.assertTrue(result['ok'])
+    return [(r.get('qn'), r.get('codecid'), r.get('bandwidth')) for r in result['resources']], result['predicted']
+
+  def test_default_takes_the_highest_bitrate_at_the_top_quality(self):
+    self.assertEqual(self.streams()[0], [(80, 7, 2050000), (None, None, 319000)])
+
+  def test_codec_preference_and_smallest_encoding(self):
+    self.assertEqual(self.streams(codecs='hevc,avc')[0][0], (80, 12, 1180000))
+    self.assertEqual(self.streams(prefer='smallest')[0][0], (80, 12, 1180000))
+
+  def test_bitrate_cap_steps_down_a_quality(self):
+    self.assertEqual(self.streams(max_bitrate=1000000)[0][0], (64, 12, 640000))
+
+  def test_audio_only_returns_the_best_audio_track(self):
+    self.assertEqual(self.streams(audio_only=True)[0], [(None, None, 319000)])
+
+  def test_budget_picks_the_best_streams_that_fit(self):
+    # 360 s streams: 100 kB/s for 600 s fits 720P HEVC and the best audio
+    streams, predicted = self.streams(throughput=100000, budget_seconds=600)
+    self.assertEqual(streams, [(64, 12, 640000), (None, None, 319000)])
+    self.assertEqual(predicted, {'size': (640000 + 319000) * 360 // 8, 'seconds': 431.6, 'fits_budget': True})
+
+  def test_budget_too_small_for_anything_reports_the_overrun(self):
+    streams, predicted = self.streams(throughput=10000, budget_seconds=60)
+    self.assertEqual(streams, [(16, 7, 300000), (None, None, 67000)])
+    self.assertFalse(predicted['fits_budget'])
+
+  def test_invalid_preference_is_rejected(self):
+    with self.assertRaises(ValueError):
+      bp._selection_policy(prefer='fastest')
+
+
+class ListPaginationTest(FakeAPITestCase):
+  def fail_page(self, endpoint, page_key, failing_page):
+    handler = getattr(self.api, endpoint)
+
+    def patched(query):
+      if int(query.get(page_key) or 1) == failing_page:
+        return {'code': -352, 'message': 'risk control'}
+      return handler(query)
+
+    setattr(self.api, endpoint, patched)
+    self.addCleanup(delattr, self.api, endpoint)
+
+  def test_favlist_pages_follow_media_count(self):
+    self.api.reset_counts()
+    result = bp.parse_bilibili(FAVLIST_URL, force_single=False)
+    self.assertEqual(result['total_videos'], fake_api.MEDIA_LISTS[9001])
+    self.assertEqual([v['index'] for v in result['videos']], list(range(1, fake_api.MEDIA_LISTS[9001] + 1)))
+    self.assertEqual(self.api.snapshot_counts()['fav_resource_list'], fake_api.MEDIA_LISTS[9001] // bp.MEDIA_PAGE_SIZE)
+    self.assertEqual(result['list_errors'], [])
+
+  def test_favlist_without_a_count_pages_until_has_more_is_false(self):
+    for endpoint in ('medialist_info', 'fav_resource_list'):
+      handler = getattr(self.api, endpoint)
+
+      def uncounted(query, handler=handler):
+        body = handler(query)
+        body['data'].pop('media_count', None)
+        (body['data'].get('info') or {}).pop('media_count', None)
+        return body
+
+      setattr(self.api, endpoint, uncounted)
+      self.addCleanup(delattr, self.api, endpoint)
+    result = bp.parse_bilibili(FAVLIST_URL, force_single=False)
+    self.assertEqual(result['total_videos'], fake_api.MEDIA_LISTS[9001])
+
+  def test_failed_favlist_page_keeps_the_pages_before_it(self):
+    self.fail_page('fav_resource_list', 'pn', 4)
+    result = bp.parse_bilibili(FAVLIST_URL, force_single=False)
+    self.assertEqual(result['total_videos'], 3 * bp.MEDIA_PAGE_SIZE)
+    self.assertEqual(result['list_errors'], [{'page': 4, 'error': 'risk control'}])
+
+  def test_ugc_season_pages_are_listed_in_order(self):
+    result = bp.parse_bilibili(SEASON_URL, force_single=False)
+    total = fake_api.UGC_SEASONS[5000]
+    self.assertEqual(result['total_videos'], total)
+    self.assertEqual(result['videos'][-1]['bvid'], fake_api._archive_bvid(5000, total))
+
+  def test_failed_ugc_season_page_keeps_the_partial_listing(self):
+    self.fail_page('seasons_archives_list', 'page_num', 3)
+    result = bp.parse_bilibili(SEASON_URL, force_single=False)
+    self.assertTrue(result['ok'])
+    self.assertEqual(result['total_videos'], 2 * bp.UGC_SEASON_PAGE_SIZE)
+    self.assertEqual(result['list_errors'], [{'page': 3, 'error': 'risk control'}])
+
+
+class SpeculativePlayurlTest(FakeAPITestCase):
+  def setUp(self):
+    super().setUp()
+    self.stats = bp._PLAYURL_FALLBACKS
+    bp._PLAYURL_FALLBACKS = bp._FallbackStats()
+
+  def tearDown(self):
+    bp._PLAYURL_FALLBACKS = self.stats
+
+  def fetch_play(self, qn=None, speculative=None):
+    cid = fake_api._cid_for('BV1Bench0001')
+    requested = []
+
+    async def fetch(q):
+      requested.append(q)
+      if q is None:
+        # let the top-quality request win every race
+        await asyncio.sleep(0.05)
+      return await bp._get_playurl(bvid='BV1Bench0001', cid=cid, qn=q)
+
+    async def run():
+      play = await bp._fetch_play('ugc', fetch, qn, bp.SPECULATIVE_TOP_QN, speculative)
+      others = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+      await asyncio.gather(*others, return_exceptions=True)
+      return play
+
+    bp._PLAYURL_CACHE.clear()
+    self.play = asyncio.run(run())
+    self.requested = requested
+    return len(requested) == 2
+
+  def test_forced_racing_requests_both_qualities(self):
+    self.assertTrue(self.fetch_play(speculative=True))
+    self.assertEqual(set(self.requested), {None, bp.SPECULATIVE_TOP_QN})
+    self.assertTrue(self.play['p_data']['dash'])
+    # the default request still finished and was sampled
+    self.assertEqual(bp.playurl_fallback_stats()['ugc'], {'total': 1, 'fallbacks': 0})
+
+  def test_no_racing_when_disabled_or_a_quality_is_requested(self):
+    self.assertFalse(self.fetch_play(speculative=False))
+    self.assertEqual(self.requested, [None])
+    self.assertFalse(self.fetch_play(qn='64', speculative=True))
+    self.assertEqual(self.requested, ['64'])
+
+  def test_auto_mode_waits_for_enough_samples(self):
+    for _ in range(bp.SPECULATIVE_MIN_SAMPLES - 1):
+      bp._PLAYURL_FALLBACKS.record('ugc', True)
+    self.assertFalse(self.fetch_play())
+    bp._PLAYURL_FALLBACKS.record('ugc', True)
+    self.assertTrue(self.fetch_play())
+
+  def test_racing_switches_off_when_default_stops_falling_back(self):
+    for _ in range(bp.SPECULATIVE_MIN_SAMPLES):
+      bp._PLAYURL_FALLBACKS.record('ugc', True)
+    raced = [self.fetch_play() for _ in range(40)]
+    self.assertTrue(raced[0])
+    self.assertFalse(raced[-1])
+    # races the top request won still sampled the default one
+    self.assertEqual(bp.playurl_fallback_stats()['ugc'], {'total': bp.SPECULATIVE_MIN_SAMPLES + 40, 'fallbacks': bp.SPECULATIVE_MIN_SAMPLES})
+
+
+class DaemonTest(FakeAPITestCase):
+  def setUp(self):
+    super().setUp()
+    env = dict(os.environ, BILI_API_BASE=self.api.base)
+    env.pop('BILI_CACHE_DB', None)
+    self.env = env
+    self.daemon = subprocess.Popen(
+      [sys.executable, os.path.join(ROOT, 'main.py'), '--port', '0', '--watch-stdin'],
+      stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env
+    )
+    self.ready = json.loads(self.daemon.stdout.readline())
+
+  def tearDown(self):
+    self.daemon.stdin.close()
+    self.daemon.wait(timeout=10)
+    self.daemon.stdout.close()
+
+  def request(self, payload):
+    with socket.create_connection((self.ready['host'], self.ready['port']), timeout=30) as conn:
+      conn.sendall((json.dumps(payload) + '\n').encode('utf-8'))
+      return json.loads(conn.makefile('rb').readline())
+
+  def spawn(self, *args):
+    out = subprocess.run(
+      [sys.executable, os.path.join(ROOT, 'parsers', 'bilibili_parser.py'), *args],
+      stdout=subprocess.PIPE, env=self.env, timeout=60, check=True
+    )
+    return json.loads(out.stdout)
+
+  def test_daemon_and_spawn_agree_without_force_single(self):
+    # the renderer sends force_single: null unless the caller asked for it, and passes no flag to the CLI
+    daemon = self.request({'id': 1, 'token': self.ready['token'], 'cmd': 'parse', 'url': SEASON_URL, 'force_single': None})
+    spawned = self.spawn(SEASON_URL)
+    self.assertTrue(daemon['ok'])
+    self.assertTrue(spawned['ok'])
+    self.assertEqual(daemon.get('type'), spawned.get('type'))
+    self.assertEqual(daemon['bvid'], 'BV1BenchCol5')
+
+  def test_requests_without_the_token_are_rejected(self):
+    self.assertRegex(self.ready['token'], r'^[0-9a-f]{32}$')
+    for token in (None, '', 'not-the-token', self.ready['token'][:-1]):
+      payload = {'id': 7, 'cmd': 'ping'}
+      if token is not None:
+        payload['token'] = token
+      self.assertEqual(self.request(payload), {'id': 7, 'ok': False, 'error': 'unauthorized'})
+    self.assertEqual(self.request({'id': 8, 'cmd': 'ping', 'token': self.ready['token']}), {'id': 8, 'ok': True, 'pong': True})
+
+  def test_stdio_mode_needs_no_token(self):
+    self.assertEqual(list(main._handle_line('{"id": 1, "cmd": "ping"}')), [{'id': 1, 'ok': True, 'pong': True}])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -4,10 +4,17 @@ import { existsSync } from 'node:fs'
 import { app } from 'electron'
 import is from 'electron-is'
 import logger from './Logger'
+import { getUserDataPath } from '../utils'
 
 export default class PythonManager {
   constructor () {
     this.process = null
+    this.port = 0
+    global.mediaParserCacheDb = this.getCacheDbPath()
+  }
+
+  getCacheDbPath () {
+    return join(getUserDataPath(), 'MediaParser', 'parser-cache.sqlite3')
   }
 
   getPythonPath () {
@@ -70,14 +77,40 @@ export default class PythonManager {
       return
     }
 
-    const args = [scriptPath]
+    const args = [scriptPath, '--port', '0', '--watch-stdin']
 
     logger.info('[LinkCore] Starting Python:', pythonPath, args)
     this.process = spawn(pythonPath, args, {
-      stdio: 'ignore',
-      windowsHide: true
+      stdio: ['pipe', 'pipe', 'ignore'],
+      windowsHide: true,
+      env: { ...process.env, BILI_CACHE_DB: this.getCacheDbPath() }
     })
 
+    let buffer = ''
+    const onData = (chunk) => {
+      buffer += chunk.toString('utf8')
+      const idx = buffer.indexOf('\n')
+      if (idx < 0) {
+        return
+      }
+      const line = buffer.slice(0, idx)
+      buffer = ''
+      this.process && this.process.stdout.removeListener('data', onData)
+      try {
+        const ready = JSON.parse(line)
+        if (ready && ready.event === 'ready' && ready.port && ready.token) {
+          this.port = ready.port
+          global.mediaParserToken = ready.token
+          global.mediaParserPort = ready.port
+          logger.info('[LinkCore] Media parser listening on port:', ready.port)
+        }
+      } catch (err) {
+        logger.warn('[LinkCore] Media parser ready line invalid:', line)
+      }
+      this.process && this.process.stdout.resume()
+    }
+    this.process.stdout.on('data', onData)
+
     this.process.on('error', (err) => {
       logger.error('[LinkCore] Python process error:', err)
     })
@@ -85,6 +118,9 @@ export default class PythonManager {
     this.process.on('close', (code) => {
       logger.info('[LinkCore] Python process exited with code:', code)
       this.process = null
+      this.port = 0
+      global.mediaParserPort = 0
+      global.mediaParserToken = ''
     })
   }
 
@@ -93,6 +129,9 @@ export default class PythonManager {
       logger.info('[LinkCore] Stopping Python process')
       this.process.kill()
       this.process = null
+      this.port = 0
+      global.mediaParserPort = 0
+      global.mediaParserToken = ''
     }
   }
 }
@@ -223,6 +223,7 @@ export default class Api {
       outs,
       options,
       optionsList,
+      mirrorsList,
       dirs
     } = params
 
@@ -268,7 +269,8 @@ export default class Api {
         existingNames.add(uniqueOut)
       }
 
-      const args = compactUndefined([[uri], engineOptions])
+      const mirrors = Array.isArray(mirrorsList) && Array.isArray(mirrorsList[index]) ? mirrorsList[index] : []
+      const args = compactUndefined([[uri, ...mirrors], engineOptions])
       return ['aria2.addUri', ...args]
     })
     return this.client.multicall(tasks)
@@ -428,7 +428,7 @@ const actions = {
     commit('CLEAR_TASK_SPEED_SAMPLES', gid)
   },
   addUri ({ dispatch, commit, rootState }, data) {
-    const { uris, outs, options, optionsList, dirs, priorities, bilibiliTitles, bilibiliFormats } = data
+    const { uris, outs, options, optionsList, mirrorsList, dirs, priorities, bilibiliTitles, bilibiliFormats } = data
 
     // Handle downloading file suffix
     const config = rootState.preference.config || {}
@@ -478,7 +478,7 @@ const actions = {
       })
     }
 
-    return api.addUri({ uris, outs: newOuts, options: normalizedOptions, optionsList, dirs })
+    return api.addUri({ uris, outs: newOuts, options: normalizedOptions, optionsList, mirrorsList, dirs })
       .then((res) => {
         if (Array.isArray(res)) {
           const gids = res.map(r => r && r[0]).filter(Boolean)
@@ -1,6 +1,7 @@
 import { isEmpty } from 'lodash'
 import { spawn } from 'node:child_process'
 import { existsSync, mkdirSync } from 'node:fs'
+import { connect } from 'node:net'
 import { join } from 'node:path'
 import { getGlobal } from '@electron/remote'
 import store from '@/store'
@@ -125,7 +126,89 @@ const getEmbeddedPythonCandidates = () => {
   return candidates.filter(p => p && existsSync(p))
 }
 
+const getMediaParserPort = () => {
+  try {
+    return Number(getGlobal('mediaParserPort')) || 0
+  } catch (_) {
+    return 0
+  }
+}
+
+const getMediaParserToken = () => {
+  try {
+    return `${getGlobal('mediaParserToken') || ''}`
+  } catch (_) {
+    return ''
+  }
+}
+
+const getMediaParserCacheDb = () => {
+  try {
+    return `${getGlobal('mediaParserCacheDb') || ''}`
+  } catch (_) {
+    return ''
+  }
+}
+
+let mediaParserRequestId = 0
+
+const runBilibiliDaemon = (port, url, options = {}) => new Promise((resolve, reject) => {
+  const qn = options && options.qn !== undefined && options.qn !== null ? `${options.qn}`.trim() : ''
+  const cookie = options && options.cookie ? `${options.cookie}` : ''
+  const payload = {
+    id: ++mediaParserRequestId,
+    token: getMediaParserToken(),
+    cmd: 'parse',
+    url,
+    qn: qn || null,
+    cookie: cookie.trim() ? cookie : null,
+    // null lets the daemon apply the parser's own default, as the spawned CLI does without --force-single
+    force_single: options && options.forceSingle === true ? true : null,
+    probe_sizes: options && options.probeSizes === true,
+    rank_mirrors: options && options.rankMirrors === true
+  }
+
+  const socket = connect({ host: '127.0.0.1', port })
+  let buffer = ''
+  let settled = false
+  const finish = (err, line) => {
+    if (settled) return
+    settled = true
+    socket.destroy()
+    if (err) {
+      reject(err)
+      return
+    }
+    resolve({ stdout: line, stderr: '' })
+  }
+
+  socket.setEncoding('utf8')
+  socket.setTimeout(120000)
+  socket.on('connect', () => {
+    socket.write(`${JSON.stringify(payload)}\n`)
+  })
+  socket.on('data', (chunk) => {
+    buffer += chunk
+    const idx = buffer.indexOf('\n')
+    if (idx >= 0) {
+      finish(null, buffer.slice(0, idx))
+    }
+  })
+  socket.on('timeout', () => finish(new Error('media parser timeout')))
+  socket.on('error', (err) => finish(err))
+  socket.on('close', () => finish(new Error('media parser closed')))
+})
+
 const runBilibiliParser = async (url, options = {}) => {
+  const port = getMediaParserPort()
+  if (port) {
+    try {
+      return await runBilibiliDaemon(port, url, options)
+    } catch (err) {
+      console.warn('[LinkCore] media parser daemon unavailable, spawning parser:', err && err.message)
+    }
+  }
+
   const script = getBilibiliParserPath()
   if (!script) {
     throw new Error('未找到内置解析脚本')
@@ -140,6 +223,12 @@ const runBilibiliParser = async (url, options = {}) => {
   if (forceSingle) {
     argsExtra.push('--force-single')
   }
+  if (options && options.probeSizes === true) {
+    argsExtra.push('--probe-sizes')
+  }
+  if (options && options.rankMirrors === true) {
+    argsExtra.push('--rank-mirrors')
+  }
 
   const exeCandidates = []
   const resourcesPath = process && process.resourcesPath ? `${process.resourcesPath}` : ''
@@ -200,6 +289,10 @@ const runBilibiliParser = async (url, options = {}) => {
     if (cookie && cookie.trim()) {
       env.BILI_COOKIE = cookie
     }
+    const cacheDb = getMediaParserCacheDb()
+    if (cacheDb) {
+      env.BILI_CACHE_DB = cacheDb
+    }
     const child = spawn(item.cmd, item.args, { windowsHide: true, env })
     let stdout = ''
     let stderr = ''
@@ -446,6 +539,7 @@ export const buildUriPayload = async (form, autoCategorize = false, categories =
 
   const desiredOuts = []
   const nextUris = []
+  const mirrorsList = []
   const optionsList = []
   const bilibiliTitles = []
   const bilibiliFormats = []
@@ -455,7 +549,8 @@ export const buildUriPayload = async (form, autoCategorize = false, categories =
       const parsed = await resolveBilibiliResources(u, {
         qn: form && (form.videoQn !== undefined ? form.videoQn : form.qn),
         cookie: form && form.cookie ? `${form.cookie}` : '',
-        forceSingle: true
+        forceSingle: true,
+        rankMirrors: true
       })
 
       if (parsed.type === 'collection') {
@@ -470,6 +565,7 @@ export const buildUriPayload = async (form, autoCategorize = false, categories =
         const resourceUrl = r && r.url ? `${r.url}` : ''
         if (!resourceUrl) continue
         nextUris.push(resourceUrl)
+        mirrorsList.push(Array.isArray(r.urls) ? r.urls.filter(m => m && `${m}` !== resourceUrl).map(m => `${m}`) : [])
         desiredOuts.push(r && r.name ? `${r.name}` : null)
         bilibiliTitles.push(parsed && parsed.title ? `${parsed.title}` : null)
         bilibiliFormats.push(form && form.videoFormat ? `${form.videoFormat}` : 'mp4')
@@ -520,7 +616,9 @@ export const buildUriPayload = async (form, autoCategorize = false, categories =
 
     const customReferers = Array.isArray(form.customReferers) ? form.customReferers : []
     const customUserAgents = Array.isArray(form.customUserAgents) ? form.customUserAgents : []
+    const customMirrors = Array.isArray(form.customMirrors) ? form.customMirrors : []
     const uriIndex = nextUris.length - 1
+    mirrorsList.push(Array.isArray(customMirrors[uriIndex]) ? customMirrors[uriIndex] : [])
 
     const header = buildHeaderForUri(form, u, {
       referer: customReferers[uriIndex] || null,
@@ -565,6 +663,7 @@ export const buildUriPayload = async (form, autoCategorize = false, categories =
     outs,
     options,
     optionsList,
+    mirrorsList,
     dirs: categorizedPaths.length > 0 ? categorizedPaths.map(item => item.categorizedDir) : null,
     priorities: Array.isArray(form.priorities) ? [...form.priorities] : null,
     bilibiliTitles,